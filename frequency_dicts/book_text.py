@@ -0,0 +1,203 @@
+import codecs
+import io
+import os
+import posixpath
+import re
+import zipfile
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+from ruby_strip import READ_SIZE, RubyStripper
+
+# formats read without calibre, everything else goes through ebook-convert
+NATIVE_FORMATS = (".epub", ".html", ".htm", ".xhtml")
+HTML_MEDIA_TYPES = ("application/xhtml+xml", "text/html")
+# tags that start or end a line of text
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "br",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "figcaption",
+    "footer",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hr",
+    "li",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+}
+# tags whose content is not part of the text
+SKIP_TAGS = ("head", "script", "style", "template")
+
+whitespace = re.compile(r"\s+")
+declared_encoding = re.compile(rb"""(?:encoding|charset)\s*=\s*["']?([\w.:-]+)""")
+
+
+class UnreadableBook(ValueError):
+    pass
+
+
+class TextWriter(HTMLParser):
+    """
+    Writes the text of the html it's fed, one line per paragraph/block element,
+    with the whitespace inside a line collapsed
+    Has a write method, so it can be the output of a RubyStripper.
+    """
+
+    def __init__(self, output):
+        super().__init__(convert_charrefs=True)
+        self.output = output
+        self.skip_depth = 0
+        self.line = []
+
+    def write(self, markup):
+        self.feed(markup)
+
+    def _end_line(self):
+        text = whitespace.sub(" ", "".join(self.line)).strip()
+        if text:
+            self.output.write(text)
+            self.output.write("\n")
+        self.line = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._end_line()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self._end_line()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.line.append(data)
+
+    def close(self):
+        super().close()
+        self._end_line()
+
+
+def _open_text(binary):
+    """
+    Returns:
+        binary as text, in the encoding its xml declaration or meta charset names
+        (utf8 otherwise)
+    """
+    encoding = "utf-8-sig"
+    match = declared_encoding.search(binary.peek(1024)[:1024])
+    if match is not None:
+        try:
+            encoding = codecs.lookup(match.group(1).decode("ascii")).name
+        except LookupError:
+            pass
+        if encoding == "utf-8":
+            encoding = "utf-8-sig"
+    return io.TextIOWrapper(binary, encoding=encoding, errors="replace")
+
+
+def write_html_text(binary, output):
+    """
+    Write the text of the html document in the binary file object to output,
+    without ruby annotations, reading it a block at a time
+    """
+    writer = TextWriter(output)
+    stripper = RubyStripper(writer)
+    text = _open_text(binary)
+    for block in iter(lambda: text.read(READ_SIZE), ""):
+        stripper.feed(block)
+    stripper.close()
+    writer.close()
+
+
+def epub_spine(epub):
+    """
+    Args:
+        epub    :   zipfile.ZipFile of the book
+    Returns:
+        the names of the html documents of the book, in reading order
+    """
+    container = ElementTree.fromstring(epub.read("META-INF/container.xml"))
+    rootfile = container.find(".//{*}rootfile")
+    if rootfile is None or not rootfile.get("full-path"):
+        raise UnreadableBook("no package document in META-INF/container.xml")
+    package_file = rootfile.get("full-path")
+    package = ElementTree.fromstring(epub.read(package_file))
+
+    base = posixpath.dirname(package_file)
+    items = {item.get("id"): item for item in package.iterfind(".//{*}item")}
+    names = []
+    for itemref in package.iterfind(".//{*}itemref"):
+        item = items.get(itemref.get("idref"))
+        if item is None or item.get("media-type") not in HTML_MEDIA_TYPES:
+            continue
+        href = unquote(item.get("href", "").split("#")[0])
+        names.append(posixpath.normpath(posixpath.join(base, href)))
+    if not names:
+        raise UnreadableBook("empty spine")
+
+    encrypted = _encrypted_members(epub)
+    if encrypted.intersection(names):
+        raise UnreadableBook("encrypted (DRM) content")
+    return names
+
+
+def _encrypted_members(epub):
+    # font obfuscation lists the fonts here too, only the documents matter
+    try:
+        encryption = ElementTree.fromstring(epub.read("META-INF/encryption.xml"))
+    except KeyError:
+        return set()
+    return {
+        unquote(reference.get("URI", ""))
+        for reference in encryption.iterfind(".//{*}CipherReference")
+    }
+
+
+def is_native_format(book_file) -> bool:
+    return os.path.splitext(book_file)[1].lower() in NATIVE_FORMATS
+
+
+def write_book_text(book_file, output_file):
+    """
+    Write the plain text of an EPUB (its spine documents, in order) or HTML book
+    to output_file, without calibre
+
+    Raises:
+        UnreadableBook  :   the EPUB is malformed or encrypted, calibre may still
+                            manage to convert it
+    """
+    with open(output_file, "w", encoding="utf8") as output:
+        if os.path.splitext(book_file)[1].lower() != ".epub":
+            with open(book_file, "rb") as fd:
+                write_html_text(fd, output)
+            return
+        try:
+            with zipfile.ZipFile(book_file) as epub:
+                for name in epub_spine(epub):
+                    with epub.open(name) as member:
+                        write_html_text(member, output)
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+            raise UnreadableBook(f"{type(e).__name__}: {e}") from e
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+
+# bump when the layout of the manifest changes, older manifests are then ignored
+MANIFEST_VERSION = 1
+
+CALIBRE = ("ebook-convert", "--version")
+JUMANPP = ("jumanpp", "--version")
+UNZIP = ("unzip", "-v")
+
+
+@lru_cache(maxsize=None)
+def tool_version(command) -> str:
+    """
+    Args:
+        command :   version command of the tool, e.g. ("jumanpp", "--version")
+    Returns:
+        the first line it prints, "unavailable" if it can't be run
+    """
+    try:
+        result = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unavailable"
+    lines = result.stdout.decode("utf8", "replace").strip().splitlines()
+    return lines[0].strip() if lines else "unknown"
+
+
+def _sha256_file(file) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as fd:
+        for block in iter(lambda: fd.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def remove_path(target):
+    if os.path.isdir(target) and not os.path.islink(target):
+        shutil.rmtree(target)
+    elif os.path.lexists(target):
+        os.remove(target)
+
+
+def temp_path(output) -> str:
+    """
+    temp name next to output, keeping its extension (ebook-convert picks the
+    output format from it)
+    """
+    root, ext = os.path.splitext(output)
+    return f"{root}.tmp{os.getpid()}{ext}"
+
+
+class BuildManifest:
+    """
+    Records, for every stage output (file or folder), the hashes of the inputs it
+    was built from, the version of the tool that built it and its own hash
+    An output is rebuilt when it's missing, was modified, or any of these changed,
+    so half-written outputs of a crashed run and replaced books are never reused.
+    File hashes are memoized by (size, mtime), so unchanged multi-GB files are not
+    re-read on every run.
+    The manifest is written once, by save() or when leaving a with block (also on
+    errors, so the stages finished before a crash are not rebuilt).
+
+    Usage:
+        with BuildManifest("./build_manifest.json") as manifest:
+            manifest.build(output, [input], tool_version(JUMANPP), write)
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self._lock = threading.RLock()
+        try:
+            with open(manifest_file, "r", encoding="utf8") as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            data = dict()
+        if data.get("version") != MANIFEST_VERSION:
+            data = dict()
+        self._stages = data.get("stages", dict())
+        self._file_hashes = data.get("file_hashes", dict())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+
+    def hash(self, target):
+        """
+        Returns:
+            sha256 of a file, or of the relative paths and contents of every file
+            in a folder, None if target doesn't exist
+        """
+        if os.path.isdir(target):
+            sha = hashlib.sha256()
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                for name in sorted(files):
+                    file = os.path.join(root, name)
+                    relative = os.path.relpath(file, target).replace(os.sep, "/")
+                    sha.update(f"{relative}\0{self._hash_file(file)}\0".encode("utf8"))
+            return sha.hexdigest()
+        return self._hash_file(target)
+
+    def _hash_file(self, file):
+        """
+        Returns:
+            sha256 of file, memoized by (size, mtime), None if it doesn't exist
+        """
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        with self._lock:
+            memo = self._file_hashes.get(file)
+        if memo is not None and memo[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return memo[2]
+        digest = _sha256_file(file)
+        with self._lock:
+            self._file_hashes[file] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def is_fresh(self, output, inputs, tool) -> bool:
+        with self._lock:
+            record = self._stages.get(output)
+        if record is None or record["tool"] != tool:
+            return False
+        if record["inputs"] != {i: self.hash(i) for i in inputs}:
+            return False
+        return record["output"] is not None and self.hash(output) == record["output"]
+
+    def record(self, output, inputs, tool):
+        record = {
+            "tool": tool,
+            "inputs": {i: self.hash(i) for i in inputs},
+            "output": self.hash(output),
+        }
+        with self._lock:
+            self._stages[output] = record
+
+    def build(self, output, inputs, tool, write) -> bool:
+        """
+        Rebuild output if it's stale
+        write(temp) creates the new output (file or folder) at temp, which then
+        atomically replaces output, so output is either the old or the complete
+        new version, never a partial one
+
+        Args:
+            output  :   path of the stage's output
+            inputs  :   paths the output is built from
+            tool    :   version string of whatever builds it
+            write   :   function taking the temp path to write to
+        Returns:
+            True if output was rebuilt
+        """
+        if self.is_fresh(output, inputs, tool):
+            return False
+        temp = temp_path(output)
+        remove_path(temp)
+        try:
+            write(temp)
+            remove_path(output)
+            os.replace(temp, output)
+        except BaseException:
+            remove_path(temp)
+            raise
+        self.record(output, inputs, tool)
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "stages": self._stages,
+                "file_hashes": {
+                    file: memo
+                    for file, memo in self._file_hashes.items()
+                    if os.path.exists(file)
+                },
+            }
+            temp = temp_path(self.manifest_file)
+            with open(temp, "w", encoding="utf8") as fd:
+                json.dump(data, fd, ensure_ascii=False, indent=1)
+            os.replace(temp, self.manifest_file)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+
+from text_sources import open_binary
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), ".freq_cache"
+)
+
+# bump when the stored counts would differ for the same file and tokenizer
+CACHE_VERSION = "1"
+
+
+class FreqCache:
+    """
+    Persistent per-file morpheme counts, one json file per cache key
+    The key covers the file's content hash and everything that changes the
+    counts (tokenizer/dictionary version, split mode, chunk size), so renaming a
+    file is still a hit and editing it is a miss.
+    """
+
+    def __init__(self, cache_dir, tokenizer_key: str):
+        self.cache_dir = cache_dir
+        self.tokenizer_key = tokenizer_key
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file) -> str:
+        sha = hashlib.sha256()
+        sha.update(f"{CACHE_VERSION}\0{self.tokenizer_key}\0".encode("utf8"))
+        with open_binary(file) as fd:
+            for block in iter(lambda: fd.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def has(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def get(self, key: str):
+        """
+        Returns:
+            the cached {morpheme: count} (in first appearance order), else None
+        """
+        try:
+            with open(self._path(key), "r", encoding="utf8") as fd:
+                counts = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        return counts
+
+    def put(self, key: str, counts: dict) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as fd:
+            json.dump(counts, fd, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
@@ -0,0 +1,140 @@
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+# remapped range of the document-spread multiplier of the "remap" scheme
+MIN_MULTIPLIER = 0.4
+MAX_MULTIPLIER = 1.5
+
+
+class TermDocCounts:
+    """
+    Collects per-file counts into a sparse term x document count matrix
+    Rows follow the order in which terms first appear across the files, so ties
+    keep the same order as the plain defaultdict counting did.
+    """
+
+    def __init__(self):
+        self.vocab = dict()
+        self.num_docs = 0
+        self._rows = array("q")
+        self._cols = array("q")
+        self._counts = array("q")
+
+    def add_document(self, counts: dict) -> None:
+        vocab = self.vocab
+        col = self.num_docs
+        for term, count in counts.items():
+            row = vocab.get(term)
+            if row is None:
+                row = vocab[term] = len(vocab)
+            self._rows.append(row)
+            self._cols.append(col)
+            self._counts.append(count)
+        self.num_docs += 1
+
+    def to_csr(self):
+        """
+        Returns:
+            (terms x documents) scipy.sparse.csr_matrix of raw counts
+        """
+        return sparse.csr_matrix(
+            (
+                np.frombuffer(self._counts, dtype=np.int64),
+                (
+                    np.frombuffer(self._rows, dtype=np.int64),
+                    np.frombuffer(self._cols, dtype=np.int64),
+                ),
+            ),
+            shape=(len(self.vocab), self.num_docs),
+        )
+
+
+def _term_totals(matrix):
+    return np.asarray(matrix.sum(axis=1)).ravel()
+
+
+def _document_frequency(matrix):
+    return np.diff(matrix.indptr)
+
+
+def weight_none(matrix):
+    """
+    raw total count of each term
+    """
+    return _term_totals(matrix)
+
+
+def weight_remap(matrix):
+    """
+    total count x (fraction of books containing the term, remapped to 0.4 - 1.5)
+    """
+    multiplier = _document_frequency(matrix) / matrix.shape[1]
+    distance = MAX_MULTIPLIER - MIN_MULTIPLIER
+    multiplier = (multiplier * distance) + MIN_MULTIPLIER
+    return _term_totals(matrix) * multiplier
+
+
+def weight_log_tf(matrix):
+    """
+    sum over books of (1 + ln(count in book)), dampens words spammed in one book
+    """
+    log_matrix = matrix.astype(np.float64)
+    log_matrix.data = 1.0 + np.log(log_matrix.data)
+    return _term_totals(log_matrix)
+
+
+def weight_tf_idf(matrix):
+    """
+    total count x smoothed idf, ln((1 + books) / (1 + books containing it)) + 1
+    """
+    num_docs = matrix.shape[1]
+    idf = np.log((1 + num_docs) / (1 + _document_frequency(matrix))) + 1.0
+    return _term_totals(matrix) * idf
+
+
+def weight_juilland(matrix):
+    """
+    total count x Juilland's D (1 - coefficient of variation / sqrt(books - 1)),
+    computed on per-book relative frequencies so long books don't dominate
+    """
+    num_docs = matrix.shape[1]
+    totals = _term_totals(matrix)
+    if num_docs < 2:
+        return totals.astype(np.float64)
+
+    book_sizes = np.asarray(matrix.sum(axis=0)).ravel().astype(np.float64)
+    book_sizes[book_sizes == 0] = 1.0
+    relative = sparse.csr_matrix(matrix.multiply(1.0 / book_sizes))
+
+    mean = _term_totals(relative) / num_docs
+    mean_of_squares = _term_totals(relative.multiply(relative)) / num_docs
+    std = np.sqrt(np.maximum(mean_of_squares - mean**2, 0.0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variation = np.where(mean > 0, std / mean, 0.0)
+    dispersion = np.clip(1.0 - variation / np.sqrt(num_docs - 1), 0.0, 1.0)
+    return totals * dispersion
+
+
+WEIGHTING_SCHEMES = {
+    "none": weight_none,
+    "remap": weight_remap,
+    "logtf": weight_log_tf,
+    "tfidf": weight_tf_idf,
+    "juilland": weight_juilland,
+}
+
+
+def weigh(term_doc: TermDocCounts, scheme="remap") -> dict:
+    """
+    Returns:
+        {term: weighted frequency} in first appearance order
+    """
+    if scheme not in WEIGHTING_SCHEMES:
+        raise ValueError(
+            f"unknown weighting scheme {scheme}, use one of {list(WEIGHTING_SCHEMES)}"
+        )
+    weights = WEIGHTING_SCHEMES[scheme](term_doc.to_csr())
+    return dict(zip(term_doc.vocab, weights.tolist()))
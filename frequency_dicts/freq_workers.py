@@ -0,0 +1,273 @@
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import regex as re
+from freq_cache import FreqCache
+from jp_tokenizers import DEFAULT_TOKENIZER, make_tokenizer, tokenizer_version_key
+from line_memo import LineMemo, normalize_line
+from text_chunks import (
+    DEFAULT_CHUNK_BYTES,
+    SUDACHI_MAX_BYTES,
+    group_chunks,
+    iter_text_chunks,
+    read_units,
+)
+
+CJK_PATTERN = re.compile(
+    r"([\p{IsHan}\p{IsBopo}\p{IsHira}\p{IsKatakana}]+)", re.UNICODE
+)
+
+# one tokenizer per process, created lazily (or by the pool initializer)
+_TOKENIZER = None
+_TOKENIZER_SPEC = None
+# one line memo per process, shared by all the files it counts
+_LINE_MEMO = None
+
+
+def _init_worker(tokenizer=DEFAULT_TOKENIZER):
+    global _TOKENIZER, _TOKENIZER_SPEC
+    _TOKENIZER = make_tokenizer(tokenizer)
+    _TOKENIZER_SPEC = tokenizer
+
+
+def tokenizer_key(
+    chunk_bytes=DEFAULT_CHUNK_BYTES, tokenizer=DEFAULT_TOKENIZER, line_memo=False
+) -> str:
+    """
+    Returns:
+        a string that changes whenever the tokenizer would produce different counts
+        (backend, its version/dictionary/split mode, chunk size, line by line)
+    """
+    key = f"{tokenizer_version_key(tokenizer)};chunk={chunk_bytes}"
+    if line_memo:
+        key += ";lines"
+    return key
+
+
+def _get_tokenizer(tokenizer=DEFAULT_TOKENIZER):
+    if _TOKENIZER is None or _TOKENIZER_SPEC != tokenizer:
+        _init_worker(tokenizer)
+    return _TOKENIZER
+
+
+def _get_line_memo(line_cache_bytes):
+    global _LINE_MEMO
+    if _LINE_MEMO is None or _LINE_MEMO.max_bytes != line_cache_bytes:
+        _LINE_MEMO = LineMemo(line_cache_bytes)
+    return _LINE_MEMO
+
+
+def _count_lines(file, chunk_bytes, TOKENIZER, memo, freq):
+    """
+    count_file through the line memo: every distinct line is tokenized once, the
+    lines missing from the memo are sent to the tokenizer together, up to
+    chunk_bytes at a time
+    """
+    batch_bytes = min(chunk_bytes, SUDACHI_MAX_BYTES) if chunk_bytes > 0 else 0
+    # lines read since the last tokenizer call, counted once their forms are known
+    window = []
+    resolved = dict()
+    misses = dict()
+    miss_bytes = 0
+
+    def count(forms):
+        for token in forms:
+            freq[token] += 1
+
+    def flush():
+        nonlocal miss_bytes
+        if misses:
+            lines = list(misses)
+            for line, forms in zip(lines, TOKENIZER.base_forms_per_line(lines)):
+                forms = [token for token in forms if CJK_PATTERN.match(token)]
+                memo.put(line, forms)
+                resolved[line] = forms
+        for line in window:
+            count(resolved[line])
+        window.clear()
+        resolved.clear()
+        misses.clear()
+        miss_bytes = 0
+
+    for unit in read_units(file):
+        for line in unit.splitlines():
+            line = normalize_line(line)
+            if not line:
+                continue
+            size = len(line.encode("utf8")) + 1
+
+            if size + 1 > SUDACHI_MAX_BYTES:
+                # too long to be one tokenizer call, and to be worth caching
+                flush()
+                for piece in group_chunks((line,), SUDACHI_MAX_BYTES):
+                    count(
+                        t for t in TOKENIZER.base_forms(piece) if CJK_PATTERN.match(t)
+                    )
+                continue
+
+            if line in resolved or line in misses:
+                memo.count_hit()
+            else:
+                forms = memo.get(line)
+                if forms is not None:
+                    if not window:
+                        count(forms)
+                        continue
+                    resolved[line] = forms
+                else:
+                    if misses and miss_bytes + size + 1 > batch_bytes:
+                        flush()
+                    misses[line] = None
+                    miss_bytes += size
+            window.append(line)
+    flush()
+
+
+def count_file(
+    file,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+    tokenizer=DEFAULT_TOKENIZER,
+    line_cache_bytes=0,
+) -> dict:
+    """
+    Tokenize a single file, one tokenizer call per chunk of chunk_bytes
+
+    Args:
+        tokenizer   :   jp_tokenizers spec, e.g. "sudachi:B:full" or "jumanpp"
+        line_cache_bytes    :   size of the per-process memo of tokenized lines,
+                                repeated lines then skip the tokenizer
+                                0 to tokenize whole chunks without memo
+    Returns:
+        {dictionary form: count} of the CJK morphemes of the file,
+        in order of first appearance
+    """
+    TOKENIZER = _get_tokenizer(tokenizer)
+    freq = defaultdict(int)
+
+    if line_cache_bytes > 0:
+        memo = _get_line_memo(line_cache_bytes)
+        _count_lines(file, chunk_bytes, TOKENIZER, memo, freq)
+        return dict(freq)
+
+    for chunk in iter_text_chunks(file, chunk_bytes):
+        for token in TOKENIZER.base_forms(chunk):
+            if CJK_PATTERN.match(token):
+                freq[token] += 1
+
+    return dict(freq)
+
+
+def _count_file_job(file, chunk_bytes, tokenizer, line_cache_bytes):
+    """
+    Returns:
+        (count_file's counts, the line memo's hits/misses/evictions for this file)
+    """
+    if line_cache_bytes <= 0:
+        return count_file(file, chunk_bytes, tokenizer), None
+    before = _get_line_memo(line_cache_bytes).stats()
+    counts = count_file(file, chunk_bytes, tokenizer, line_cache_bytes)
+    after = _LINE_MEMO.stats()
+    return counts, {name: after[name] - before[name] for name in after}
+
+
+def iter_file_counts(
+    files,
+    jobs=1,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+    cache_dir=None,
+    tokenizer=DEFAULT_TOKENIZER,
+    line_cache_bytes=0,
+):
+    """
+    Count every file, in a process pool of `jobs` workers if jobs > 1
+    Each worker holds its own tokenizer (a jp_tokenizers spec), and its own line
+    memo of line_cache_bytes if that's > 0
+
+    With a cache_dir, the counts of every file are stored under its content hash
+    and only new or changed files are tokenized on the next run
+
+    files is read lazily, only a couple of files per worker ahead of the one
+    being yielded, so it can be a generator over any number of files
+
+    Yields:
+        (file, per-file counts) in the same order as files, regardless of
+        which worker finished first, so merging them is deterministic
+    """
+    cache = None
+    if cache_dir:
+        cache = FreqCache(
+            cache_dir, tokenizer_key(chunk_bytes, tokenizer, line_cache_bytes > 0)
+        )
+
+    executor = None
+    # (file, cache key, cached counts, future) of the files read ahead, in order
+    pending = deque()
+    lookahead = 2 * max(jobs, 1)
+    hits = 0
+    misses = 0
+    memo_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def finish(file, key, counts, future):
+        nonlocal hits, misses
+        if counts is not None:
+            hits += 1
+            return counts
+        misses += 1
+        if future is not None:
+            counts, file_memo_stats = future.result()
+        else:
+            counts, file_memo_stats = _count_file_job(
+                file, chunk_bytes, tokenizer, line_cache_bytes
+            )
+        if file_memo_stats is not None:
+            for name, value in file_memo_stats.items():
+                memo_stats[name] += value
+        if cache is not None:
+            cache.put(key, counts)
+        return counts
+
+    def drain(keep):
+        nonlocal done
+        while len(pending) > keep:
+            entry = pending.popleft()
+            done += 1
+            print(f"{done}: processing {os.path.basename(entry[0])}")
+            yield entry[0], finish(*entry)
+
+    done = 0
+    try:
+        for file in files:
+            key = None
+            counts = None
+            future = None
+            if cache is not None:
+                key = cache.key(file)
+                # None for new files and unreadable cache entries alike
+                counts = cache.get(key)
+            if counts is None and jobs > 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(
+                        max_workers=jobs,
+                        initializer=_init_worker,
+                        initargs=(tokenizer,),
+                    )
+                future = executor.submit(
+                    _count_file_job, file, chunk_bytes, tokenizer, line_cache_bytes
+                )
+            pending.append((file, key, counts, future))
+            yield from drain(lookahead - 1)
+        yield from drain(0)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if cache is not None:
+        print(f"file cache: {hits} hits, {misses} misses (tokenized)")
+    if line_cache_bytes > 0:
+        lines = memo_stats["hits"] + memo_stats["misses"]
+        print(
+            f"line cache: {memo_stats['hits']} of {lines} lines "
+            f"({100 * memo_stats['hits'] / max(lines, 1):.1f}%) skipped the tokenizer, "
+            f"{memo_stats['evictions']} evictions"
+        )
@@ -0,0 +1,315 @@
+import getopt
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+from build_manifest import JUMANPP, tool_version
+from jumanpp_parse import TOKEN_LINE
+from jumanpp_pool import JumanppWorker, clean_line
+from text_chunks import DEFAULT_CHUNK_BYTES, iter_text_chunks
+
+SUDACHI_MODES = ("A", "B", "C")
+SUDACHI_DICTS = ("small", "core", "full")
+
+DEFAULT_TOKENIZER = "sudachi:B:full"
+
+
+def _package_version(package) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _field(text):
+    # parse files are space separated
+    return "_".join(text.split())
+
+
+class SudachiTokenizer:
+    """
+    sudachipy with one of its split modes (A short - C long units) and dictionaries
+    """
+
+    def __init__(self, mode="B", dict_type="full"):
+        from sudachipy import dictionary, tokenizer
+
+        self.mode_name = mode
+        self.dict_type = dict_type
+        self.mode = getattr(tokenizer.Tokenizer.SplitMode, mode)
+        self._tokenizer = dictionary.Dictionary(dict_type=dict_type).create()
+
+    @staticmethod
+    def version_key(mode="B", dict_type="full") -> str:
+        return ";".join(
+            [
+                f"sudachipy={_package_version('sudachipy')}",
+                f"sudachidict_{dict_type}="
+                f"{_package_version(f'sudachidict_{dict_type}')}",
+                f"mode={mode}",
+            ]
+        )
+
+    def analyse(self, text):
+        return [
+            (m.surface(), m.dictionary_form())
+            for m in self._tokenizer.tokenize(text, self.mode)
+        ]
+
+    def base_forms(self, text):
+        return [m.dictionary_form() for m in self._tokenizer.tokenize(text, self.mode)]
+
+    def base_forms_per_line(self, lines):
+        """
+        Tokenize non-blank lines without newlines in one call
+        Every line sits between two newline tokens, which no path through
+        sudachi's lattice can skip, so a line gets the same tokens whatever lines
+        it's batched with.
+
+        Returns:
+            one list of dictionary forms per line
+        """
+        text = "\n" + "\n".join(lines) + "\n"
+        result = []
+        current = None
+        for m in self._tokenizer.tokenize(text, self.mode):
+            surface = m.surface()
+            if "\n" in surface:
+                for _ in range(surface.count("\n")):
+                    if current is not None:
+                        result.append(current)
+                    current = []
+            elif current is not None:
+                current.append(m.dictionary_form())
+        if len(result) != len(lines):
+            # lines were not what this expects (blank, or with newlines)
+            return [self.base_forms(line) for line in lines]
+        return result
+
+    def close(self):
+        pass
+
+
+class JumanppTokenizer:
+    """
+    a long-lived jumanpp process, fed the non-blank lines of the text
+    """
+
+    def __init__(self):
+        self._worker = JumanppWorker()
+
+    @staticmethod
+    def version_key() -> str:
+        return f"jumanpp={tool_version(JUMANPP)}"
+
+    def analyse(self, text):
+        lines = [clean_line(line) for line in text.splitlines() if line.strip()]
+        if not lines:
+            return []
+        output = self._worker.analyse(lines).encode("utf8")
+        return [
+            (surface.decode("utf8"), base.decode("utf8"))
+            for eos, surface, base in TOKEN_LINE.findall(output)
+            if not eos
+        ]
+
+    def base_forms(self, text):
+        return [base for _, base in self.analyse(text)]
+
+    def base_forms_per_line(self, lines):
+        output = self._worker.analyse([clean_line(line) for line in lines])
+        result = []
+        current = []
+        for eos, _, base in TOKEN_LINE.findall(output.encode("utf8")):
+            if eos:
+                result.append(current)
+                current = []
+            else:
+                current.append(base.decode("utf8"))
+        return result
+
+    def close(self):
+        self._worker.close()
+
+
+class FugashiTokenizer:
+    """
+    MeCab through fugashi, with whichever unidic it finds
+    """
+
+    def __init__(self):
+        import fugashi
+
+        self._tagger = fugashi.Tagger()
+
+    @staticmethod
+    def version_key() -> str:
+        versions = [f"fugashi={_package_version('fugashi')}"]
+        for package in ("unidic", "unidic-lite"):
+            version = _package_version(package)
+            if version != "unknown":
+                versions.append(f"{package}={version}")
+        return ";".join(versions)
+
+    @staticmethod
+    def _lemma(word):
+        # unknown words have no lemma
+        return getattr(word.feature, "lemma", None) or word.surface
+
+    def analyse(self, text):
+        return [(word.surface, self._lemma(word)) for word in self._tagger(text)]
+
+    def base_forms(self, text):
+        return [self._lemma(word) for word in self._tagger(text)]
+
+    def base_forms_per_line(self, lines):
+        return [self.base_forms(line) for line in lines]
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "sudachi": SudachiTokenizer,
+    "jumanpp": JumanppTokenizer,
+    "fugashi": FugashiTokenizer,
+}
+
+
+def _parse_spec(spec):
+    """
+    "sudachi:B:full" -> (SudachiTokenizer, ("B", "full")), "jumanpp" -> (..., ())
+    """
+    name, *args = spec.split(":")
+    if name not in BACKENDS:
+        raise ValueError(f"unknown tokenizer {spec}, use one of {list(BACKENDS)}")
+    if name == "sudachi":
+        mode = args[0] if len(args) > 0 else "B"
+        dict_type = args[1] if len(args) > 1 else "full"
+        if mode not in SUDACHI_MODES or dict_type not in SUDACHI_DICTS:
+            modes = "|".join(SUDACHI_MODES)
+            dict_types = "|".join(SUDACHI_DICTS)
+            raise ValueError(
+                f"unknown sudachi setting {spec}, use sudachi:<{modes}>:<{dict_types}>"
+            )
+        args = (mode, dict_type)
+    elif args:
+        raise ValueError(f"{name} takes no settings, got {spec}")
+    return BACKENDS[name], tuple(args)
+
+
+def make_tokenizer(spec=DEFAULT_TOKENIZER):
+    """
+    Args:
+        spec    :   "sudachi[:<A|B|C>[:<small|core|full>]]", "jumanpp" or "fugashi"
+    Returns:
+        a tokenizer with analyse(text) -> [(surface, dictionary form)],
+        base_forms(text) -> [dictionary form],
+        base_forms_per_line(lines) -> [[dictionary form] per line] and close()
+    """
+    backend, args = _parse_spec(spec)
+    return backend(*args)
+
+
+def tokenizer_version_key(spec=DEFAULT_TOKENIZER) -> str:
+    """
+    Returns:
+        a string that changes whenever the tokenizer of spec would produce different
+        tokens, without loading it
+    """
+    backend, args = _parse_spec(spec)
+    key = backend.version_key(*args)
+    if backend is SudachiTokenizer:
+        # same key as before other backends existed, so existing caches stay valid
+        return key
+    return f"{spec};{key}"
+
+
+def write_parse_file(tokenizer, input_file, output_file):
+    """
+    Write the tokens of every non-blank line of input_file in the jumanpp output
+    layout (surface reading base, an EOS after every line), the reading is left "_"
+    """
+    with open(input_file, "r", encoding="utf8") as fd, open(
+        output_file, "w", encoding="utf8"
+    ) as output:
+        for line in fd:
+            if not line.strip():
+                continue
+            for surface, base in tokenizer.analyse(line.rstrip("\r\n")):
+                if surface.strip() and base.strip():
+                    output.write(f"{_field(surface)} _ {_field(base)}\n")
+            output.write("EOS\n")
+
+
+def _benchmark_backend(spec, files, chunk_bytes):
+    start = time.perf_counter()
+    tokenizer = make_tokenizer(spec)
+    load_seconds = time.perf_counter() - start
+
+    tokens = 0
+    start = time.perf_counter()
+    for file in files:
+        for chunk in iter_text_chunks(file, chunk_bytes):
+            tokens += len(tokenizer.base_forms(chunk))
+    seconds = time.perf_counter() - start
+    tokenizer.close()
+
+    try:
+        # unix only, the tokenizers themselves work everywhere
+        import resource
+    except ImportError:
+        return tokens, load_seconds, seconds, None
+    # linux reports kB, jumanpp runs in a child process
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return tokens, load_seconds, seconds, peak_kb
+
+
+def benchmark_specs():
+    specs = [f"sudachi:{m}:{d}" for d in SUDACHI_DICTS for m in SUDACHI_MODES]
+    return specs + ["jumanpp", "fugashi"]
+
+
+def benchmark(files, specs=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Tokenize files with every backend, each in a fresh process so peak RSS isn't
+    shared, and print tokens, tokens/sec and peak RSS (n/a where the resource
+    module is missing, i.e. on Windows)
+    Backends that aren't installed are reported and skipped.
+    """
+    specs = benchmark_specs() if specs is None else specs
+    context = multiprocessing.get_context("spawn")
+
+    print(
+        f"{'backend':18} {'tokens':>10} {'load s':>8} {'tokens/s':>10} {'peak RSS':>10}"
+    )
+    for spec in specs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                tokens, load_seconds, seconds, peak_kb = executor.submit(
+                    _benchmark_backend, spec, files, chunk_bytes
+                ).result()
+            except Exception as e:
+                print(f"{spec:18} unavailable ({type(e).__name__}: {e})")
+                continue
+        peak = "n/a" if peak_kb is None else f"{peak_kb / 1024:.0f}MB"
+        print(
+            f"{spec:18} {tokens:>10} {load_seconds:>8.2f} "
+            f"{tokens / max(seconds, 1e-9):>10.0f} {peak:>10}"
+        )
+
+
+if __name__ == "__main__":
+    # python jp_tokenizers.py [-b sudachi:B:core -b jumanpp ...] [-c <bytes>] files
+    opts, files = getopt.getopt(sys.argv[1:], "b:c:", ["backend=", "chunk-bytes="])
+    specs = [arg for opt, arg in opts if opt in ("-b", "--backend")] or None
+    chunk_bytes = DEFAULT_CHUNK_BYTES
+    for opt, arg in opts:
+        if opt in ("-c", "--chunk-bytes"):
+            chunk_bytes = int(arg)
+    benchmark(files, specs, chunk_bytes)
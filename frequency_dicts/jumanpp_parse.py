@@ -0,0 +1,157 @@
+import mmap
+import re
+import sys
+import time
+
+# the regex engine scans the mapped bytes directly, a window at a time, only the
+# captured columns are copied out
+WINDOW_BYTES = 16 * 1024 * 1024
+
+_FIELD = rb"([^ \t\r\n]+)"
+_SKIP_FIELD = rb"[^ \t\r\n]+"
+_SEP = rb"[ \t]+"
+# surface reading base ... , lines with fewer fields (EOS, *, blank) never match
+BASE_FORM_LINE = re.compile(
+    rb"^[ \t]*" + _SKIP_FIELD + _SEP + _SKIP_FIELD + _SEP + _FIELD, re.MULTILINE
+)
+# (EOS, "", "") or ("", surface, base)
+SENTENCE_LINE = re.compile(
+    rb"^[ \t]*(?:(EOS)[ \t\r]*$|" + _FIELD + _SEP + _SKIP_FIELD + _SEP + _FIELD + rb")",
+    re.MULTILINE,
+)
+# SENTENCE_LINE without jumanpp's alternative analyses ("@ 人 ひと 人 ..." lines
+# right after the morpheme they are an alternative of), for the tokenizer backend
+# read_sentences keeps them, like the parser of the dictionary files always did
+TOKEN_LINE = re.compile(
+    rb"^[ \t]*(?:(EOS)[ \t\r]*$|(?!@[ \t])"
+    + _FIELD
+    + _SEP
+    + _SKIP_FIELD
+    + _SEP
+    + _FIELD
+    + rb")",
+    re.MULTILINE,
+)
+
+
+def _iter_window_matches(parse_file, pattern):
+    with open(parse_file, "rb") as fd:
+        try:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file, nothing to map
+            return
+    with mapped:
+        size = len(mapped)
+        start = 0
+        while start < size:
+            end = start + WINDOW_BYTES
+            if end >= size:
+                end = size
+            else:
+                # end the window right after a newline, so no line is cut in two
+                newline = mapped.rfind(b"\n", start, end)
+                if newline >= start:
+                    end = newline + 1
+            yield from pattern.findall(mapped, start, end)
+            start = end
+
+
+def iter_base_forms(parse_file):
+    """
+    Yields:
+        the base form (3rd column) of every morpheme of a jumanpp output file
+    """
+    for base in _iter_window_matches(parse_file, BASE_FORM_LINE):
+        yield base.decode("utf8")
+
+
+def read_sentences(parse_file):
+    """
+    Returns:
+        (base forms, surfaces), one list per non-empty EOS terminated sentence
+    """
+    bases = []
+    surfaces = []
+    base_acc = []
+    surface_acc = []
+    for eos, surface, base in _iter_window_matches(parse_file, SENTENCE_LINE):
+        if eos:
+            if base_acc:
+                bases.append(base_acc)
+                surfaces.append(surface_acc)
+                base_acc = []
+                surface_acc = []
+            continue
+        base_acc.append(base.decode("utf8"))
+        surface_acc.append(surface.decode("utf8"))
+    return bases, surfaces
+
+
+def _legacy_base_forms(parse_file):
+    # book.load_parse before the mmap parser, kept for the benchmark
+    re_nl = re.compile("[ \n\t]+")
+    with open(parse_file) as fd:
+        lines = [[j for j in re_nl.split(i.strip()) if len(j) > 0] for i in fd]
+    lines = [i for i in lines if len(i) > 0 and i[0] != "EOS"]
+    return [i[2] for i in lines]
+
+
+def _legacy_read_sentences(parse_file):
+    # read_jumanpp before the mmap parser, kept for the benchmark
+    res = []
+    originals = []
+    acc = []
+    original = []
+    with open(parse_file) as fd:
+        for i in map(str.strip, fd):
+            if i == "EOS":
+                if len(acc) > 0:
+                    res.append(acc)
+                    originals.append(original)
+                    original = []
+                    acc = []
+            elif i == "*":
+                continue
+            else:
+                i = [j for j in i.split() if len(j) > 0]
+
+                acc.append(i[2])
+                original.append(i[0])
+    return res, originals
+
+
+def benchmark(parse_file, repeat=3):
+    """
+    Time the legacy line-splitting parsers against the mmap ones on parse_file,
+    and check that they agree
+    """
+    with open(parse_file, "rb") as fd:
+        size_mb = len(fd.read()) / 1e6
+
+    parsers = [
+        ("load_parse (split)", lambda: _legacy_base_forms(parse_file)),
+        ("iter_base_forms (mmap)", lambda: list(iter_base_forms(parse_file))),
+        ("read_jumanpp (split)", lambda: _legacy_read_sentences(parse_file)),
+        ("read_sentences (mmap)", lambda: read_sentences(parse_file)),
+    ]
+    results = dict()
+    for name, parse in parsers:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name] = parse()
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:24} {best:8.3f}s {size_mb / best:8.1f} MB/s")
+
+    if results["load_parse (split)"] != results["iter_base_forms (mmap)"]:
+        print("base forms differ from load_parse")
+    if results["read_jumanpp (split)"] != results["read_sentences (mmap)"]:
+        print("sentences differ from read_jumanpp")
+
+
+if __name__ == "__main__":
+    # python jumanpp_parse.py <file.parse>...
+    for parse_file in sys.argv[1:]:
+        print(parse_file)
+        benchmark(parse_file)
@@ -0,0 +1,277 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+
+JUMANPP_COMMAND = ("jumanpp",)
+# a batch is what one worker analyses in one go, it's also the unit of retry and
+# the size of the restartable chunks
+BATCH_LINES = 2000
+BATCH_BYTES = 256 * 1024
+BATCH_TIMEOUT = 600
+RETRIES = 2
+REPORT_EVERY = 30
+
+
+class JumanppError(RuntimeError):
+    pass
+
+
+class JumanppWorker:
+    """
+    One long-lived jumanpp process, fed batches of lines over its stdin
+    jumanpp prints one EOS per input line, which tells where a batch's output ends.
+    """
+
+    def __init__(self, command=JUMANPP_COMMAND):
+        self.process = Popen(
+            command, stdin=PIPE, stdout=PIPE, stderr=DEVNULL, encoding="utf8"
+        )
+        self.output = queue.Queue()
+        # drained all the time, so jumanpp never blocks on a full stdout pipe
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.output.put(line)
+        self.output.put(None)
+
+    def analyse(self, lines, timeout=BATCH_TIMEOUT) -> str:
+        """
+        Args:
+            lines   :   non-empty lines without line endings
+            timeout :   seconds after which the process is killed
+        Returns:
+            jumanpp's output for lines
+        """
+        watchdog = threading.Timer(timeout, self.kill)
+        watchdog.start()
+        try:
+            try:
+                for line in lines:
+                    self.process.stdin.write(line)
+                    self.process.stdin.write("\n")
+                self.process.stdin.flush()
+            except OSError as e:
+                raise JumanppError(f"jumanpp stopped reading its input: {e}")
+
+            result = []
+            remaining = len(lines)
+            while remaining:
+                line = self.output.get()
+                if line is None:
+                    raise JumanppError("jumanpp exited in the middle of a batch")
+                result.append(line)
+                if line.rstrip() == "EOS":
+                    remaining -= 1
+            return "".join(result)
+        finally:
+            watchdog.cancel()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except TimeoutExpired:
+            self.kill()
+
+
+def clean_line(line):
+    # jumanpp reads a line starting with # as a comment and prints no EOS for it
+    line = line.rstrip("\r\n")
+    if line.startswith("#"):
+        line = "＃" + line[1:]
+    return line
+
+
+def iter_batches(input_file, batch_lines=BATCH_LINES, batch_bytes=BATCH_BYTES):
+    """
+    Yields:
+        lists of the non-blank lines of input_file, at most batch_lines lines or
+        about batch_bytes utf8 bytes each
+    """
+    batch = []
+    size = 0
+    with open(input_file, "r", encoding="utf8") as fd:
+        for line in fd:
+            line = clean_line(line)
+            if not line.strip():
+                continue
+            batch.append(line)
+            size += len(line.encode("utf8")) + 1
+            if len(batch) >= batch_lines or size >= batch_bytes:
+                yield batch
+                batch = []
+                size = 0
+    if batch:
+        yield batch
+
+
+class JumanppPool:
+    """
+    A pool of long-lived jumanpp workers, that analyses files a batch at a time
+    Failed or timed out batches are retried on a fresh process, and every finished
+    batch is kept as a chunk file, so an interrupted file restarts where it stopped.
+    """
+
+    def __init__(
+        self,
+        workers,
+        command=JUMANPP_COMMAND,
+        batch_lines=BATCH_LINES,
+        batch_bytes=BATCH_BYTES,
+        timeout=BATCH_TIMEOUT,
+        retries=RETRIES,
+    ):
+        self.workers = max(workers, 1)
+        self.command = command
+        self.batch_lines = batch_lines
+        self.batch_bytes = batch_bytes
+        self.timeout = timeout
+        self.retries = retries
+        self._executor = None
+        self._closed = False
+        self._local = threading.local()
+        self._started = []
+        self._lock = threading.Lock()
+        self.start_time = None
+        self.lines = 0
+        self.bytes = 0
+        self.cached_batches = 0
+        self.retried_batches = 0
+        self._last_report = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._closed:
+                raise JumanppError("the jumanpp pool is closed")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                self.start_time = time.monotonic()
+                self._last_report = self.start_time
+            return self._executor
+
+    def _worker(self):
+        worker = getattr(self._local, "worker", None)
+        if worker is None:
+            worker = self._local.worker = JumanppWorker(self.command)
+            with self._lock:
+                self._started.append(worker)
+        return worker
+
+    def _drop_worker(self):
+        worker = getattr(self._local, "worker", None)
+        if worker is not None:
+            worker.kill()
+            self._local.worker = None
+
+    def _analyse_batch(self, lines, chunk_file):
+        if chunk_file is not None and os.path.isfile(chunk_file):
+            with open(chunk_file, "r", encoding="utf8") as fd:
+                result = fd.read()
+            self._count(lines, cached=True)
+            return result
+
+        for attempt in range(self.retries + 1):
+            try:
+                result = self._worker().analyse(lines, self.timeout)
+                break
+            except JumanppError:
+                self._drop_worker()
+                if attempt == self.retries:
+                    raise
+                with self._lock:
+                    self.retried_batches += 1
+
+        if chunk_file is not None:
+            # the same batch can show up twice in a file, keep the threads apart
+            temp = f"{chunk_file}.{threading.get_ident()}.tmp"
+            with open(temp, "w", encoding="utf8") as fd:
+                fd.write(result)
+            os.replace(temp, chunk_file)
+        self._count(lines)
+        return result
+
+    def _count(self, lines, cached=False):
+        with self._lock:
+            self.lines += len(lines)
+            self.bytes += sum(len(line.encode("utf8")) + 1 for line in lines)
+            if cached:
+                self.cached_batches += 1
+            now = time.monotonic()
+            if now - self._last_report >= REPORT_EVERY:
+                self._last_report = now
+                print(self.report())
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - (self.start_time or time.monotonic()), 1e-9)
+        megabytes = self.bytes / 1e6
+        return (
+            f"jumanpp: {self.lines} lines, {megabytes:.1f} MB in {elapsed:.0f}s "
+            f"({self.lines / elapsed:.0f} lines/s, {megabytes / elapsed:.2f} MB/s), "
+            f"{self.cached_batches} batches from chunks, "
+            f"{self.retried_batches} retried"
+        )
+
+    def analyse_file(self, input_file, output_file, chunk_dir=None, key=""):
+        """
+        Analyse input_file into output_file, in batches spread over the workers
+        Blank lines are skipped.
+
+        Args:
+            chunk_dir   :   where finished batches are kept until the whole file is
+                            done, batches already there are not analysed again
+            key         :   anything that changes jumanpp's output (its version),
+                            part of the chunk file names
+        """
+        executor = self._get_executor()
+        if chunk_dir is not None:
+            os.makedirs(chunk_dir, exist_ok=True)
+
+        def chunk_file(lines):
+            if chunk_dir is None:
+                return None
+            sha = hashlib.sha256(key.encode("utf8"))
+            for line in lines:
+                sha.update(line.encode("utf8"))
+                sha.update(b"\n")
+            return os.path.join(chunk_dir, f"{sha.hexdigest()[:32]}.parse")
+
+        # batches in flight, results are written in input order
+        pending = deque()
+        with open(output_file, "w", encoding="utf8") as output:
+            for lines in iter_batches(input_file, self.batch_lines, self.batch_bytes):
+                pending.append(
+                    executor.submit(self._analyse_batch, lines, chunk_file(lines))
+                )
+                if len(pending) >= 2 * self.workers:
+                    output.write(pending.popleft().result())
+            while pending:
+                output.write(pending.popleft().result())
+
+    def close(self):
+        """
+        Stop the workers, analysing more files with this pool raises JumanppError
+        """
+        with self._lock:
+            self._closed = True
+            executor = self._executor
+            self._executor = None
+            workers = self._started
+            self._started = []
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,69 @@
+import sys
+from collections import OrderedDict
+
+
+class LineMemo:
+    """
+    LRU cache of line -> dictionary forms, bounded by the approximate memory its
+    entries use rather than their number, so a few very long lines can't push out
+    thousands of short catchphrases
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _size(line, forms):
+        return (
+            sys.getsizeof(line)
+            + sys.getsizeof(forms)
+            + sum(sys.getsizeof(form) for form in forms)
+        )
+
+    def get(self, line):
+        """
+        Returns:
+            the cached forms of line (and counts a hit), else None (and counts a miss)
+        """
+        entry = self._entries.get(line)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(line)
+        self.hits += 1
+        return entry[0]
+
+    def count_hit(self):
+        # a line found elsewhere than in the memo, e.g. already waiting to be tokenized
+        self.hits += 1
+
+    def put(self, line, forms):
+        forms = tuple(forms)
+        size = self._size(line, forms)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(line, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[line] = (forms, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def normalize_line(line):
+    # the same subtitle line often comes with different surrounding whitespace
+    return line.strip()
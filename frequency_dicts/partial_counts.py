@@ -0,0 +1,211 @@
+import gzip
+import heapq
+import json
+import os
+from collections import deque
+from itertools import chain
+
+from freq_cache import DEFAULT_CACHE_DIR
+from freq_workers import iter_file_counts, tokenizer_key
+from jp_tokenizers import DEFAULT_TOKENIZER
+from text_chunks import DEFAULT_CHUNK_BYTES
+
+# bump when the layout of partial count files changes
+PARTIAL_VERSION = 1
+PARTIAL_FORMAT = "yomi_freq partial counts"
+
+
+def parse_shard(text):
+    """
+    "2/8" -> (2, 8), the second of 8 shards
+    """
+    try:
+        shard, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"shard should look like 2/8, got {text}")
+    if not 1 <= shard <= shards:
+        raise ValueError(f"shard {shard} is not between 1 and {shards}")
+    return shard, shards
+
+
+def select_shard(files, shard=(1, 1)):
+    """
+    The shards take every n-th file in turn (which spreads big and small files
+    over all the shards), files has to come in the same order on every machine
+    (text_sources.iter_sources lists folders sorted)
+
+    Returns:
+        [(position of the file in files, file)] of the shard
+    """
+    shard, shards = shard
+    return [
+        (position, file)
+        for position, file in enumerate(files)
+        if position % shards == shard - 1
+    ]
+
+
+def write_partial_counts(
+    partial_file, file_counts, tokenizer_key, shard=(1, 1), files_total=None
+):
+    """
+    Write the per-file counts of a (shard of a) corpus, gzipped json lines: a
+    header, then one [position, file, {morpheme: count}] line per file
+
+    Args:
+        file_counts     :   iterable of (position, file, counts), by position
+        tokenizer_key   :   freq_workers.tokenizer_key of the counts, merging
+                            counts of different tokenizers is refused
+        shard           :   (shard, shards) the files were selected with
+        files_total     :   number of files of the whole corpus (of all shards)
+    """
+    temp = f"{partial_file}.{os.getpid()}.tmp"
+    header = {
+        "format": PARTIAL_FORMAT,
+        "version": PARTIAL_VERSION,
+        "tokenizer_key": tokenizer_key,
+        "shard": list(shard),
+        "files_total": files_total,
+    }
+    # mtime=0 so the same counts always give the same bytes
+    with open(temp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as binary:
+            write = binary.write
+            write(_json_line(header))
+            for position, file, counts in file_counts:
+                write(_json_line([position, file, counts]))
+    os.replace(temp, partial_file)
+
+
+def _json_line(data):
+    line = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"{line}\n".encode("utf8")
+
+
+def read_partial_counts(partial_file):
+    """
+    Returns:
+        (header, iterator of (position, file, counts))
+    """
+    fd = gzip.open(partial_file, "rt", encoding="utf8")
+    try:
+        header = json.loads(fd.readline())
+    except ValueError:
+        fd.close()
+        raise ValueError(f"{partial_file} is not a partial count file")
+    if not isinstance(header, dict) or header.get("format") != PARTIAL_FORMAT:
+        fd.close()
+        raise ValueError(f"{partial_file} is not a partial count file")
+    if header.get("version") != PARTIAL_VERSION:
+        fd.close()
+        raise ValueError(
+            f"{partial_file} has version {header.get('version')}, "
+            f"this script reads version {PARTIAL_VERSION}"
+        )
+
+    def entries():
+        with fd:
+            for line in fd:
+                position, file, counts = json.loads(line)
+                yield position, file, counts
+
+    return header, entries()
+
+
+def merge_partial_counts(partial_files):
+    """
+    Merge partial count files into the per-file counts of the whole corpus, in
+    the order a single run over it would count the files
+    A complete set of shards (1/n ... n/n) of one corpus is merged by file
+    position, otherwise the files are taken in the order given, each in its own
+    order.
+
+    Returns:
+        iterator of (file, counts)
+    Raises:
+        ValueError  :   not partial count files, counted with different
+                        tokenizers, or an incomplete/duplicated set of shards
+    """
+    headers = []
+    readers = []
+    for partial_file in partial_files:
+        header, entries = read_partial_counts(partial_file)
+        headers.append(header)
+        readers.append(entries)
+    if not headers:
+        return iter(())
+
+    keys = {header["tokenizer_key"] for header in headers}
+    if len(keys) > 1:
+        raise ValueError(
+            "partial counts from different tokenizers (or versions, chunk sizes) "
+            f"can't be merged: {sorted(keys)}"
+        )
+
+    shards = sorted(tuple(header["shard"]) for header in headers)
+    if all(shard_count == 1 for _, shard_count in shards):
+        merged = chain.from_iterable(readers)
+    else:
+        shard_count = shards[-1][1]
+        expected = [(shard, shard_count) for shard in range(1, shard_count + 1)]
+        totals = {header["files_total"] for header in headers}
+        if shards != expected or len(totals) > 1:
+            raise ValueError(
+                f"expected the shards {expected} of one corpus, got {shards}"
+            )
+        merged = heapq.merge(*readers, key=lambda entry: entry[0])
+    return ((file, counts) for _, file, counts in merged)
+
+
+def count_to_partial(
+    partial_file,
+    files,
+    shard=None,
+    jobs=1,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+    cache_dir=DEFAULT_CACHE_DIR,
+    tokenizer=DEFAULT_TOKENIZER,
+    line_cache_bytes=0,
+):
+    """
+    The map step: count files (or only their shard) with freq_workers and write
+    their per-file counts to partial_file
+
+    Args:
+        files   :   any iterable of text_sources sources
+        shard   :   (shard, shards) to count only that shard of files, None to
+                    count all of them
+    other args as freq_workers.iter_file_counts
+    """
+    if shard is None:
+        shard = (1, 1)
+        files_total = None
+        selected = enumerate(files)
+    else:
+        files = list(files)
+        files_total = len(files)
+        selected = select_shard(files, shard)
+
+    # positions of the files handed to iter_file_counts but not yielded yet
+    positions = deque()
+
+    def shard_files():
+        for position, file in selected:
+            positions.append(position)
+            yield file
+
+    file_counts = iter_file_counts(
+        shard_files(),
+        jobs=jobs,
+        chunk_bytes=chunk_bytes,
+        cache_dir=cache_dir,
+        tokenizer=tokenizer,
+        line_cache_bytes=line_cache_bytes,
+    )
+    write_partial_counts(
+        partial_file,
+        ((positions.popleft(), file, counts) for file, counts in file_counts),
+        tokenizer_key(chunk_bytes, tokenizer, line_cache_bytes > 0),
+        shard,
+        files_total,
+    )
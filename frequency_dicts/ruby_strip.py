@@ -0,0 +1,125 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+
+word = re.compile(r"[\s\n]*")
+
+READ_SIZE = 64 * 1024
+# content that has to be written back as is, not escaped
+RAW_TEXT_TAGS = ("script", "style")
+
+
+class RubyStripper(HTMLParser):
+    """
+    Streaming html filter that drops every <rt> (with its content) and replaces
+    every <ruby> by its remaining text without whitespace or <rp> parentheses, e.g.
+    <ruby>漢<rt>かん</rt>字<rt>じ</rt></ruby> -> 漢字
+    Everything else is written back unchanged, as soon as it's parsed.
+    """
+
+    def __init__(self, output):
+        super().__init__(convert_charrefs=True)
+        self.output = output
+        self.ruby_depth = 0
+        self.ruby_text = []
+        self.in_rt = False
+        self.in_rp = False
+        self.in_raw_text = False
+
+    def _write_ruby(self):
+        self.output.write(escape(word.sub("", "".join(self.ruby_text)), quote=False))
+        self.ruby_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "rt":
+            self.in_rt = True
+            return
+        if self.in_rt and tag == "rp":
+            # </rt> is optional before the next <rp>
+            self.in_rt = False
+        if self.in_rt:
+            return
+        if tag == "ruby":
+            self.ruby_depth += 1
+            return
+        if self.ruby_depth:
+            if tag == "rp":
+                self.in_rp = True
+            return
+        self.in_raw_text = tag in RAW_TEXT_TAGS
+        self.output.write(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if self.in_rt or self.ruby_depth or tag in ("rt", "ruby"):
+            return
+        self.output.write(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag == "rt":
+            self.in_rt = False
+            return
+        if tag == "rp" and self.ruby_depth:
+            self.in_rp = False
+            return
+        if tag == "ruby":
+            # </ruby> also closes an unterminated <rt>/<rp>
+            self.in_rt = False
+            self.in_rp = False
+            if self.ruby_depth:
+                self.ruby_depth -= 1
+                if not self.ruby_depth:
+                    self._write_ruby()
+            return
+        if self.in_rt or self.ruby_depth:
+            return
+        self.in_raw_text = False
+        self.output.write(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.in_rt:
+            return
+        if self.ruby_depth:
+            if not self.in_rp:
+                self.ruby_text.append(data)
+        elif self.in_raw_text:
+            self.output.write(data)
+        else:
+            self.output.write(escape(data, quote=False))
+
+    def handle_comment(self, data):
+        if not (self.in_rt or self.ruby_depth):
+            self.output.write(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.output.write(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.output.write(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        # the parser ends <![CDATA[...]]> at "]]>", other marked sections at "]>"
+        if data.startswith("CDATA["):
+            self.output.write(f"<![{data}]]>")
+        else:
+            self.output.write(f"<![{data}]>")
+
+    def close(self):
+        super().close()
+        if self.ruby_depth:
+            # unterminated <ruby> at the end of the document
+            self.ruby_depth = 0
+            self._write_ruby()
+
+
+def strip_ruby_file(input_file, output_file):
+    """
+    Write input_file without its ruby annotations to output_file, reading and
+    writing it a block at a time
+    """
+    with open(input_file, "r", encoding="utf8") as fd, open(
+        output_file, "w", encoding="utf8"
+    ) as output:
+        stripper = RubyStripper(output)
+        for block in iter(lambda: fd.read(READ_SIZE), ""):
+            stripper.feed(block)
+        stripper.close()
@@ -0,0 +1,221 @@
+import hashlib
+import heapq
+import json
+import os
+import sys
+import tempfile
+from itertools import groupby
+
+import numpy as np
+
+# rough memory of one dict entry besides its key: hash table slot, count int
+ENTRY_BYTES = 100
+SKETCH_DEPTH = 4
+
+
+class CountMinSketch:
+    """
+    Fixed-size approximate counter, its estimates are never below the true count
+    Uses conservative updates, which keep the overestimate of rare terms small.
+    """
+
+    def __init__(self, max_bytes, depth=SKETCH_DEPTH):
+        self.depth = depth
+        self.width = max(max_bytes // (4 * depth), 1)
+        self.table = np.zeros((depth, self.width), dtype=np.uint32)
+        self._rows = np.arange(depth)
+
+    def _columns(self, term):
+        # deterministic across runs, unlike hash()
+        digest = hashlib.blake2b(term.encode("utf8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, term, count) -> int:
+        """
+        Returns:
+            the estimate of term after adding count
+        """
+        columns = self._columns(term)
+        cells = self.table[self._rows, columns]
+        after = min(int(cells.min()) + count, np.iinfo(np.uint32).max)
+        self.table[self._rows, columns] = np.maximum(cells, after)
+        return after
+
+    def estimate(self, term) -> int:
+        return int(self.table[self._rows, self._columns(term)].min())
+
+
+def _write_run(file, entries):
+    with open(file, "w", encoding="utf8") as fd:
+        for entry in entries:
+            fd.write(json.dumps(entry, ensure_ascii=False))
+            fd.write("\n")
+
+
+def _read_run(file):
+    with open(file, "r", encoding="utf8") as fd:
+        for line in fd:
+            yield json.loads(line)
+
+
+def _rank_order(entry):
+    # decreasing count, then first appearance
+    return -entry[1], entry[2]
+
+
+class SpillCounter:
+    """
+    Morpheme counter with a memory ceiling: when its table grows past max_bytes,
+    the table is written to disk sorted by term and started over, and the runs
+    are merged at the end
+    Terms keep their first appearance, so ranked() orders ties exactly like
+    sorting a defaultdict would.
+
+    With min_count > 1 terms counted fewer times are dropped, and with a
+    sketch_bytes Count-Min sketch a term only gets a table entry once the sketch
+    says it may have reached min_count, so the long tail of rare terms never uses
+    table memory or disk. An admitted term starts from the sketch's estimate of
+    its counts so far and is counted exactly from then on, so only that first
+    part can be overestimated (by at most the sketch's error), and frequent terms
+    stay close to exact.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None, min_count=1, sketch_bytes=0):
+        self.max_bytes = max_bytes
+        self.min_count = min_count
+        self.sketch = None
+        if sketch_bytes > 0 and min_count > 1:
+            self.sketch = CountMinSketch(sketch_bytes)
+        # removed when the counter is garbage collected (or at exit)
+        self._spill_dir = tempfile.TemporaryDirectory(
+            prefix="yomi_freq_spill_", dir=spill_dir
+        )
+        self.table = dict()
+        # sketch estimates the table's terms were admitted with
+        self.seeds = dict()
+        self.table_bytes = 0
+        # first appearance number of the first term of the current table
+        self.table_offset = 0
+        self.runs = []
+
+    def _run_file(self, kind):
+        return os.path.join(self._spill_dir.name, f"{kind}{len(self.runs)}.jsonl")
+
+    def add(self, counts: dict):
+        table = self.table
+        sketch = self.sketch
+        min_count = self.min_count
+        seeds = self.seeds
+        for term, count in counts.items():
+            if term in table:
+                table[term] += count
+                continue
+            if sketch is not None:
+                # only the counts from before the term is admitted are estimated
+                after = sketch.add(term, count)
+                if after < min_count:
+                    continue
+                seeds[term] = after - count
+                self.table_bytes += ENTRY_BYTES
+            table[term] = count
+            self.table_bytes += sys.getsizeof(term) + ENTRY_BYTES
+        if self.table_bytes > self.max_bytes:
+            self.spill()
+
+    def _table_entries(self):
+        """
+        Returns:
+            [term, exact count, first appearance, sketch estimate of the counts
+            before the term was admitted] of the table, sorted by term
+        """
+        offset = self.table_offset
+        seeds = self.seeds
+        entries = [
+            [term, count, offset + i, seeds.get(term, 0)]
+            for i, (term, count) in enumerate(self.table.items())
+        ]
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def spill(self):
+        if not self.table:
+            return
+        file = self._run_file("counts")
+        _write_run(file, self._table_entries())
+        self.runs.append(file)
+        self.table_offset += len(self.table)
+        self.table = dict()
+        self.seeds = dict()
+        self.table_bytes = 0
+
+    def _merged(self):
+        """
+        Yields:
+            [term, total count, first appearance] of every term reaching
+            min_count, by term
+        """
+        runs = [_read_run(file) for file in self.runs]
+        runs.append(iter(self._table_entries()))
+        # the table now lives on in that list only
+        self.table = dict()
+        self.seeds = dict()
+        self.table_bytes = 0
+        merged = heapq.merge(*runs, key=lambda entry: entry[0])
+        for term, entries in groupby(merged, key=lambda entry: entry[0]):
+            count = 0
+            first = None
+            seed = 0
+            for _, run_count, run_first, run_seed in entries:
+                count += run_count
+                # the first admission's seed, later ones (after a spill) would
+                # count the exact counts of the earlier runs again
+                if first is None or run_first < first:
+                    first = run_first
+                    seed = run_seed
+            count += seed
+            if count >= self.min_count:
+                yield term, count, first
+
+    def ranked(self):
+        """
+        Returns:
+            (number of terms, iterator of (term, count) by decreasing count, ties
+            in order of first appearance), sorted on disk in runs of the same
+            memory ceiling when the counts don't fit
+        """
+        entries_per_run = max(self.max_bytes // ENTRY_BYTES, 1)
+        total = 0
+        rank_runs = []
+        batch = []
+        for entry in self._merged():
+            batch.append(entry)
+            total += 1
+            if len(batch) >= entries_per_run:
+                batch.sort(key=_rank_order)
+                file = self._run_file(f"rank{len(rank_runs)}_")
+                _write_run(file, batch)
+                rank_runs.append(file)
+                batch = []
+        batch.sort(key=_rank_order)
+        runs = [_read_run(file) for file in rank_runs] + [iter(batch)]
+        merged = heapq.merge(*runs, key=_rank_order)
+        return total, ((term, count) for term, count, _ in merged)
+
+    def close(self):
+        self._spill_dir.cleanup()
+
+
+def ranked_counts(freq):
+    """
+    Args:
+        freq    :   {term: count} or a SpillCounter
+    Returns:
+        (number of terms, iterator of (term, count) by decreasing count, ties in
+        first appearance order)
+    """
+    if isinstance(freq, SpillCounter):
+        return freq.ranked()
+    ranked = sorted(freq, key=freq.get, reverse=True)
+    return len(ranked), ((term, freq[term]) for term in ranked)
@@ -0,0 +1,52 @@
+import io
+import json
+import zipfile
+from itertools import islice
+
+# fixed member timestamps, so the same input always gives a byte-identical zip
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# entries per term_meta_bank_N.json, yomichan imports many small banks faster than
+# one huge one
+BANK_SIZE = 10000
+
+
+def _write_bank(zip_file, name, entries):
+    info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zip_file.open(info, "w") as member, io.TextIOWrapper(
+        member, encoding="utf8"
+    ) as fd:
+        # same layout as json.dumps of the whole list
+        fd.write("[")
+        for i, entry in enumerate(entries):
+            if i:
+                fd.write(", ")
+            fd.write(json.dumps(entry, ensure_ascii=False))
+        fd.write("]")
+
+
+def write_dictionary_zip(output_file, index, entries, bank_size=BANK_SIZE):
+    """
+    Write a yomichan dictionary zip, the entries go into term_meta_bank_1.json,
+    term_meta_bank_2.json... of bank_size entries each, streamed into the zip
+    one entry at a time, so neither the full list nor its json is ever in memory
+
+    Args:
+        index   :   the index.json dict (title, format, revision)
+        entries :   iterable of term_meta_bank entries, e.g. [term, "freq", value],
+                    in the order they should be written
+    """
+    entries = iter(entries)
+    with zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(
+            zipfile.ZipInfo("index.json", ZIP_DATE_TIME),
+            json.dumps(index, ensure_ascii=False),
+            zipfile.ZIP_DEFLATED,
+        )
+        bank = 1
+        batch = list(islice(entries, bank_size))
+        # an empty dictionary still gets its (empty) first bank
+        while batch or bank == 1:
+            _write_bank(zip_file, f"term_meta_bank_{bank}.json", batch)
+            bank += 1
+            batch = list(islice(entries, bank_size))
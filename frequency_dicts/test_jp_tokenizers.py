@@ -0,0 +1,54 @@
+from jp_tokenizers import JumanppTokenizer
+from jumanpp_parse import TOKEN_LINE
+
+# jumanpp output for 人が走る。 and 猫, 人 has an alternative analysis
+JUMANPP_OUTPUT = """\
+人 ひと 人 名詞 6 普通名詞 1 * 0 * 0 "代表表記:人/ひと カテゴリ:人"
+@ 人 じん 人 名詞 6 普通名詞 1 * 0 * 0 "代表表記:人/じん カテゴリ:人"
+が が が 助詞 9 格助詞 1 * 0 * 0 NIL
+走る はしる 走る 動詞 2 * 0 子音動詞ラ行 10 基本形 2 "代表表記:走る/はしる"
+。 。 。 特殊 1 句点 1 * 0 * 0 NIL
+EOS
+猫 ねこ 猫 名詞 6 普通名詞 1 * 0 * 0 "代表表記:猫/ねこ"
+EOS
+"""
+
+
+class FixedWorker:
+    """
+    stands in for the jumanpp process, answers every batch with JUMANPP_OUTPUT
+    """
+
+    def analyse(self, lines, timeout=None):
+        return JUMANPP_OUTPUT
+
+    def close(self):
+        pass
+
+
+def fixed_tokenizer():
+    tokenizer = JumanppTokenizer.__new__(JumanppTokenizer)
+    tokenizer._worker = FixedWorker()
+    return tokenizer
+
+
+def test_token_line_skips_alternative_analyses():
+    matches = TOKEN_LINE.findall(JUMANPP_OUTPUT.encode("utf8"))
+    surfaces = [surface.decode("utf8") for _, surface, _ in matches]
+    assert surfaces == ["人", "が", "走る", "。", "", "猫", ""]
+
+
+def test_analyse_skips_alternative_analyses():
+    tokens = fixed_tokenizer().analyse("人が走る。\n猫")
+    assert tokens == [
+        ("人", "人"),
+        ("が", "が"),
+        ("走る", "走る"),
+        ("。", "。"),
+        ("猫", "猫"),
+    ]
+
+
+def test_base_forms_per_line_skips_alternative_analyses():
+    per_line = fixed_tokenizer().base_forms_per_line(["人が走る。", "猫"])
+    assert per_line == [["人", "が", "走る", "。"], ["猫"]]
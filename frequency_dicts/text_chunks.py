@@ -0,0 +1,99 @@
+from epub2txt import epub2txt
+from text_sources import open_text
+
+# sudachi refuses to tokenize inputs longer than this (in utf8 bytes)
+SUDACHI_MAX_BYTES = 49149
+DEFAULT_CHUNK_BYTES = 16 * 1024
+
+SENTENCE_END = "。"
+
+
+def iter_sentences(text: str):
+    """
+    Split a text right after each 。, without dropping or adding characters
+    """
+    start = 0
+    while True:
+        end = text.find(SENTENCE_END, start)
+        if end == -1:
+            if start < len(text):
+                yield text[start:]
+            break
+        yield text[start : end + 1]
+        start = end + 1
+
+
+def read_units(file):
+    """
+    Yields:
+        the lines of a txt file or any text_sources source (line endings kept), or
+        the 。-split sentences of the chapters of an epub
+    """
+    if file.endswith(".epub"):
+        for content in epub2txt(file, outputlist=True):
+            yield from iter_sentences(content)
+        return
+
+    with open_text(file) as fd:
+        yield from fd
+
+
+def _split_oversized(text: str, max_bytes: int):
+    # a character is at most 4 bytes in utf8
+    step = max(max_bytes // 4, 1)
+    for start in range(0, len(text), step):
+        yield text[start : start + step]
+
+
+def group_chunks(units, chunk_bytes):
+    """
+    Join consecutive text units into chunks of at most chunk_bytes (utf8)
+    A unit longer than chunk_bytes is cut after each of its 。 and, if a sentence
+    is still too long, wherever it has to be
+    """
+    buffer = []
+    buffer_bytes = 0
+    for unit in units:
+        unit_bytes = len(unit.encode("utf8"))
+
+        if buffer and buffer_bytes + unit_bytes > chunk_bytes:
+            yield "".join(buffer)
+            buffer = []
+            buffer_bytes = 0
+
+        if unit_bytes > chunk_bytes:
+            sentences = list(iter_sentences(unit))
+            if len(sentences) > 1:
+                yield from group_chunks(sentences, chunk_bytes)
+            else:
+                yield from _split_oversized(unit, chunk_bytes)
+            continue
+
+        buffer.append(unit)
+        buffer_bytes += unit_bytes
+
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_text_chunks(file, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Stream a txt/epub file as chunks of at most chunk_bytes (utf8), so one
+    tokenizer call handles many short lines
+    Chunks are only cut between lines (between 。-sentences for epubs)
+    Sudachi's lattice still sees the newline before each line, so a few tokens at
+    the start of a line can differ from tokenizing the line alone
+
+    Args:
+        chunk_bytes :   max size of a chunk, capped to what sudachi accepts
+                        0 to hand every line to sudachi on its own (the old behaviour)
+    Yields:
+        consecutive pieces of the file's text, concatenating them gives back the text
+    """
+    if chunk_bytes <= 0:
+        return (
+            chunk
+            for unit in read_units(file)
+            for chunk in group_chunks((unit,), SUDACHI_MAX_BYTES)
+        )
+    return group_chunks(read_units(file), min(chunk_bytes, SUDACHI_MAX_BYTES))
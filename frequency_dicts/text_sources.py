@@ -0,0 +1,126 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zipfile
+from collections import OrderedDict
+
+# "pack.zip::season1/ep01.srt" is the member season1/ep01.srt of pack.zip
+MEMBER_SEPARATOR = "::"
+ARCHIVE_EXTENSIONS = (".zip",)
+# books that have their own reader (text_chunks.read_units), only as plain files
+BOOK_EXTENSIONS = (".epub",)
+# zip archives kept open per process, so reading the members of a subtitle pack one
+# after the other doesn't re-read its central directory every time
+MAX_OPEN_ARCHIVES = 4
+
+_archives = OrderedDict()
+
+
+def _open_zstd(file):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"{file}: reading .zst files needs zstandard (pip install)")
+    return zstandard.open(file, "rb")
+
+
+DECOMPRESSORS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".zst": _open_zstd,
+}
+
+
+def _extension(name) -> str:
+    return os.path.splitext(name)[1].lower()
+
+
+def split_member(source):
+    """
+    Returns:
+        (archive, member) of an archive member source, (source, None) otherwise
+    """
+    archive, separator, member = source.partition(MEMBER_SEPARATOR)
+    if separator and _extension(archive) in ARCHIVE_EXTENSIONS:
+        return archive, member
+    return source, None
+
+
+def _archive(file):
+    archive = _archives.get(file)
+    if archive is None:
+        archive = _archives[file] = zipfile.ZipFile(file)
+        if len(_archives) > MAX_OPEN_ARCHIVES:
+            # members still being read keep their own reference to the file
+            _, oldest = _archives.popitem(last=False)
+            oldest.close()
+    else:
+        _archives.move_to_end(file)
+    return archive
+
+
+def _iter_members(file):
+    with zipfile.ZipFile(file) as archive:
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    for name in sorted(names):
+        if _extension(name) in ARCHIVE_EXTENSIONS + BOOK_EXTENSIONS:
+            print(f"skipping {name} in {file}, nested archives/books aren't read")
+            continue
+        yield f"{file}{MEMBER_SEPARATOR}{name}"
+
+
+def _iter_path(path):
+    if _extension(path) in ARCHIVE_EXTENSIONS:
+        yield from _iter_members(path)
+    else:
+        yield path
+
+
+def iter_sources(paths):
+    """
+    Lazily list every text source under paths: files, the files of folders
+    (recursively, in sorted order) and the members of .zip archives
+    Nothing is opened except the central directory of each archive.
+
+    Yields:
+        source names for open_text/open_binary, plain paths for plain files
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield from _iter_path(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield from _iter_path(os.path.join(root, name))
+
+
+def open_binary(source):
+    """
+    Returns:
+        the stored bytes of source: a plain file as it is on disk (still
+        compressed), an archive member decompressed from its archive
+    """
+    archive, member = split_member(source)
+    if member is None:
+        return open(source, "rb")
+    return _archive(archive).open(member)
+
+
+def open_text(source):
+    """
+    Returns:
+        the utf8 text of source, decompressed on the fly (.gz, .bz2, .xz, .zst)
+    """
+    archive, member = split_member(source)
+    decompress = DECOMPRESSORS.get(_extension(member or source))
+    if member is None and decompress is not None:
+        binary = decompress(source)
+    elif decompress is not None:
+        binary = decompress(_archive(archive).open(member))
+    else:
+        binary = open_binary(source)
+    return io.TextIOWrapper(binary, encoding="UTF-8")
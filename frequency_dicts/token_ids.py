@@ -0,0 +1,104 @@
+import json
+import os
+import uuid
+from array import array
+
+import numpy as np
+from build_manifest import temp_path
+
+
+class Vocabulary:
+    """
+    Append-only stem <-> integer id table, persisted between runs so the token id
+    arrays written by earlier runs stay valid
+    vocab_id changes whenever the table is started over, which makes every array
+    built against the old table stale.
+    """
+
+    def __init__(self, vocab_file):
+        self.vocab_file = vocab_file
+        try:
+            with open(vocab_file, "r", encoding="utf8") as fd:
+                data = json.load(fd)
+            self.vocab_id = data["id"]
+            self.stems = data["stems"]
+        except (OSError, ValueError, KeyError):
+            self.vocab_id = uuid.uuid4().hex
+            self.stems = []
+        self.ids = {stem: i for i, stem in enumerate(self.stems)}
+        self._saved_size = len(self.stems) if self.stems else -1
+
+    def __len__(self):
+        return len(self.stems)
+
+    def intern(self, stem) -> int:
+        i = self.ids.get(stem)
+        if i is None:
+            i = self.ids[stem] = len(self.stems)
+            self.stems.append(stem)
+        return i
+
+    def intern_all(self, stems):
+        """
+        Returns:
+            int32 numpy array of the ids of stems
+        """
+        ids = self.ids
+        out = array("i")
+        for stem in stems:
+            i = ids.get(stem)
+            if i is None:
+                i = self.intern(stem)
+            out.append(i)
+        return np.frombuffer(out, dtype=np.int32)
+
+    def save(self):
+        if len(self.stems) == self._saved_size:
+            return
+        temp = temp_path(self.vocab_file)
+        with open(temp, "w", encoding="utf8") as fd:
+            json.dump(
+                {"id": self.vocab_id, "stems": self.stems},
+                fd,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(temp, self.vocab_file)
+        self._saved_size = len(self.stems)
+
+
+def save_token_ids(file, token_ids):
+    # file should end with .npy, np.save appends it otherwise
+    np.save(file, np.asarray(token_ids, dtype=np.int32))
+
+
+def load_token_ids(file):
+    """
+    Returns:
+        the int32 token ids saved in file, memory-mapped read-only
+    """
+    return np.load(file, mmap_mode="r")
+
+
+def first_appearance_order(token_ids):
+    """
+    Returns:
+        the distinct ids of token_ids, in order of first appearance
+    """
+    unique, first = np.unique(token_ids, return_index=True)
+    return unique[np.argsort(first, kind="stable")].tolist()
+
+
+def add_counts(totals, token_ids):
+    """
+    Returns:
+        totals (int64 array indexed by id) plus the occurrences of every id in
+        token_ids, grown when token_ids has ids past its end
+    """
+    counts = np.bincount(token_ids)
+    if len(counts) > len(totals):
+        totals = np.concatenate(
+            (totals, np.zeros(len(counts) - len(totals), dtype=np.int64))
+        )
+    totals[: len(counts)] += counts
+    return totals
@@ -1,12 +1,37 @@
+import getopt
 import json
 import os
 import re
-from collections import defaultdict
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import path
 from pathlib import Path
-from subprocess import Popen, call
-
-from bs4 import BeautifulSoup
+from subprocess import Popen, check_call
+
+import numpy as np
+from book_text import UnreadableBook, is_native_format, write_book_text
+from build_manifest import (
+    CALIBRE,
+    JUMANPP,
+    UNZIP,
+    BuildManifest,
+    remove_path,
+    tool_version,
+)
+from jp_tokenizers import make_tokenizer, tokenizer_version_key, write_parse_file
+from jumanpp_parse import iter_base_forms, read_sentences
+from jumanpp_pool import JumanppPool
+from ruby_strip import strip_ruby_file
+from term_bank import write_dictionary_zip
+from token_ids import (
+    Vocabulary,
+    add_counts,
+    first_appearance_order,
+    load_token_ids,
+    save_token_ids,
+)
 
 try:
     from tqdm.auto import tqdm
@@ -16,14 +41,11 @@ except ImportError:
         return x
 
 
-word = re.compile("[\s\n]*")
-re_nl = re.compile("[ \n\t]+")
-
 zhtml_dir = "./zhtml"
 html_dir = "./html"
+clean_html_dir = "./clean_html"
 txt_dir = "./txt"
 parse_dir = "./parse"
-freq_dic_dir = "./freq_dict"
 dic_dir = "./dictionary"
 extract_dic_dir = "./extract_dic_dir"
 text_dic_dir = "./text_dic_dir"
@@ -32,8 +54,8 @@ for i in [
     txt_dir,
     zhtml_dir,
     html_dir,
+    clean_html_dir,
     parse_dir,
-    freq_dic_dir,
     extract_dic_dir,
     text_dic_dir,
     dict_parse_text_dir,
@@ -41,32 +63,61 @@ for i in [
     i = Path(i)
     i.mkdir(exist_ok=True)
 
-
-def read_jumanpp(fn):
-    res = []
-    originals = []
-    acc = []
-    original = []
-    with open(fn) as fd:
-        for i in map(str.strip, fd):
-            if i == "EOS":
-                if len(acc) > 0:
-                    res.append(acc)
-                    originals.append(original)
-                    original = []
-                    acc = []
-            elif i == "*":
-                continue
-            else:
-                i = [j for j in i.split() if len(j) > 0]
-
-                acc.append(i[2])
-                original.append(i[0])
-    return res, originals
+# input/output hashes and tool versions of every stage output built so far
+manifest = BuildManifest("./build_manifest.json")
+# versions of the in-process stages, bump when their output changes
+DICT_TEXT_VERSION = "convert_to_text 1"
+CLEAN_HTML_VERSION = "clean_html 2"
+BOOK_TEXT_VERSION = "book_text 1"
+
+# jp_tokenizers spec of the tokenizer writing the parse files
+tokenizer_spec = "jumanpp"
+# long-lived jumanpp processes shared by every book and dictionary, started with
+# -j workers in __main__
+jumanpp_pool = None
+# other tokenizers, one per stage thread
+_thread_tokenizers = threading.local()
+
+
+def _thread_tokenizer():
+    if getattr(_thread_tokenizers, "tokenizer", None) is None:
+        _thread_tokenizers.tokenizer = make_tokenizer(tokenizer_spec)
+    return _thread_tokenizers.tokenizer
+
+
+def analyse_text(input_file, parse_file):
+    """
+    Build parse_file from input_file with the selected tokenizer if it's stale
+    jumanpp goes through the worker pool: finished batches are kept in
+    parse_file.chunks until the whole file is done, so an interrupted run
+    (e.g. JMDict's word list) resumes from the last batch.
+    Other tokenizers write the same layout (surface reading base / EOS).
+    """
+    if tokenizer_spec != "jumanpp":
+        manifest.build(
+            parse_file,
+            [input_file],
+            tokenizer_version_key(tokenizer_spec),
+            lambda temp: write_parse_file(_thread_tokenizer(), input_file, temp),
+        )
+        return
+
+    version = tool_version(JUMANPP)
+    chunk_dir = parse_file + ".chunks"
+    manifest.build(
+        parse_file,
+        [input_file],
+        version,
+        lambda temp: jumanpp_pool.analyse_file(
+            input_file, temp, chunk_dir=chunk_dir, key=version
+        ),
+    )
+    remove_path(chunk_dir)
 
 
 class yomi_dict:
     def __init__(self, filename, dir=dic_dir):
+        self.source_file = path.join(dir, filename)
         filename = path.splitext(filename)[0]
         self.file = path.join(dir, filename)
         self.filename = filename
@@ -75,16 +126,22 @@ class yomi_dict:
         self.dict_parse_text = path.join(dict_parse_text_dir, filename)
 
     def extract(self):
-        if path.exists(self.extract_dir):
-            return
-        call(["unzip", self.file, "-d", self.extract_dir])
+        manifest.build(
+            self.extract_dir,
+            [self.source_file],
+            tool_version(UNZIP),
+            lambda temp: check_call(["unzip", self.source_file, "-d", temp]),
+        )
 
     def convert_to_text(self):
-        if path.exists(self.dict_text):
-            return
         self.extract()
+        manifest.build(
+            self.dict_text, [self.extract_dir], DICT_TEXT_VERSION, self.write_text
+        )
+
+    def write_text(self, output):
         words = []
-        with open(self.dict_text, "w") as fd:
+        with open(output, "w") as fd:
             for i in os.listdir(self.extract_dir):
                 if re.match("term_bank_\d+\.json", i) is None:
                     continue
@@ -94,93 +151,137 @@ class yomi_dict:
                     words.append(i[0])
                     if len(i[1].strip()) > 0:
                         words.append(i[1])
-            words = set(words)
+            # dict instead of set, so the same dictionary always gives the same text
+            words = dict.fromkeys(words)
             for w in words:
                 fd.write(w)
                 fd.write("\n")
 
     def pare_text(self):
-        if path.exists(self.dict_parse_text):
-            return
         self.convert_to_text()
-        with open(self.dict_parse_text, "w") as output:
-            with open(self.dict_text) as input:
-                call("jumanpp", stdin=input, stdout=output)
+        analyse_text(self.dict_text, self.dict_parse_text)
 
     def load_words(self):
         self.pare_text()
-        self.words, self.originals = read_jumanpp(self.dict_parse_text)
+        self.words, self.originals = read_sentences(self.dict_parse_text)
         return self
 
 
-with open(path.join(freq_dic_dir, "index.json"), "w") as fd:
-    fd.write('{"title":"Freq","format":3,"revision":"frequency1"}')
-
-
 class book:
     def __init__(self, filename, dir="."):
         self.file = path.join(dir, filename)
-        self.filename = filename[:-5]
+        self.filename = path.splitext(filename)[0]
         self.zhtml_file = path.join(zhtml_dir, self.filename + ".htmlz")
         self.html_dir = path.join(html_dir, self.filename)
         self.txt_file = path.join(txt_dir, self.filename + ".txt")
-        self.clean_html_file = path.join(self.html_dir, "clean-index.html")
+        # outside html_dir, so cleaning doesn't change the html stage's output
+        self.clean_html_file = path.join(clean_html_dir, self.filename + ".html")
         self.parse_file = path.join(parse_dir, self.filename + ".parse")
+        self.token_ids_file = path.join(parse_dir, self.filename + ".ids.npy")
+        # EPUB/HTML are read in-process, until that fails once
+        self.native = is_native_format(self.file)
 
     def htmlz(self):
-        if not path.exists(self.zhtml_file):
-            call(["ebook-convert", self.file, self.zhtml_file])
+        manifest.build(
+            self.zhtml_file,
+            [self.file],
+            tool_version(CALIBRE),
+            lambda temp: check_call(["ebook-convert", self.file, temp]),
+        )
 
     def html(self):
-        if path.exists(self.html_dir):
-            return
         self.htmlz()
-        call(["unzip", self.zhtml_file, "-d", self.html_dir])
+        manifest.build(
+            self.html_dir,
+            [self.zhtml_file],
+            tool_version(UNZIP),
+            lambda temp: check_call(["unzip", self.zhtml_file, "-d", temp]),
+        )
 
     def clean_html(self):
-        if path.exists(self.clean_html_file):
-            return
-
         self.html()
-        with open(path.join(self.html_dir, "index.html")) as fd:
-            soup = BeautifulSoup(fd.read())
-        for rt in soup.find_all("rt"):
-            rt.extract()
-        for ruby in soup.find_all("ruby"):
-            if ruby.string is None:
-                s = "".join(ruby.strings)
-            else:
-                s = ruby.string
-            s = word.sub("", s)
-            ruby.replace_with(s)
-        with open(self.clean_html_file, "w") as file:
-            file.write(str(soup))
+        manifest.build(
+            self.clean_html_file,
+            [path.join(self.html_dir, "index.html")],
+            CLEAN_HTML_VERSION,
+            lambda temp: strip_ruby_file(path.join(self.html_dir, "index.html"), temp),
+        )
 
     def txt(self):
-        if path.exists(self.txt_file):
-            return
+        if self.native:
+            try:
+                manifest.build(
+                    self.txt_file,
+                    [self.file],
+                    BOOK_TEXT_VERSION,
+                    lambda temp: write_book_text(self.file, temp),
+                )
+                return
+            except UnreadableBook as e:
+                self.native = False
+                print(f"{self.filename}: {e}, converting it with calibre instead")
         self.clean_html()
-        call(["ebook-convert", self.clean_html_file, self.txt_file])
+        manifest.build(
+            self.txt_file,
+            [self.clean_html_file],
+            tool_version(CALIBRE),
+            lambda temp: check_call(["ebook-convert", self.clean_html_file, temp]),
+        )
 
     def parse(self):
         self.txt()
-        if path.exists(self.parse_file):
-            return
-        txt_file = open(self.txt_file)
-        parse_file = open(self.parse_file, "w")
-        call("jumanpp", stdin=txt_file, stdout=parse_file)
-
-    def load_parse(self):
+        analyse_text(self.txt_file, self.parse_file)
+
+    def load_token_ids(self, vocab):
+        """
+        Returns:
+            the book's stems as vocab ids, memory-mapped from the int32 .npy file
+            saved next to its parse file (built from the parse file when stale)
+        """
         self.parse()
-        with open(self.parse_file) as fd:
-            lines = [[j for j in re_nl.split(i.strip()) if len(j) > 0] for i in fd]
-        lines = [i for i in lines if len(i) > 0 and i[0] != "EOS"]
-        self.words = [i[2] for i in lines]
+        manifest.build(
+            self.token_ids_file,
+            [self.parse_file],
+            f"token ids {vocab.vocab_id}",
+            lambda temp: self.write_token_ids(temp, vocab),
+        )
+        return load_token_ids(self.token_ids_file)
+
+    def write_token_ids(self, output, vocab):
+        token_ids = vocab.intern_all(iter_base_forms(self.parse_file))
+        # the new ids have to be on disk before any array refers to them
+        vocab.save()
+        save_token_ids(output, token_ids)
+
+
+def run_stage_chains(chains, jobs):
+    """
+    Run the stage chains of the books and dictionaries concurrently
+    A chain is the method of its last stage (book.parse, yomi_dict.pare_text), which
+    runs the missing earlier stages first. Stages are mostly subprocesses
+    (ebook-convert, unzip, jumanpp), so threads are enough to keep `jobs` of them busy
+
+    Args:
+        chains  :   functions taking no argument
+        jobs    :   max number of chains running at the same time
+    """
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [executor.submit(chain) for chain in chains]
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
 
-def add_to_count(arr, d):
-    for i in arr:
-        d[i] = d[i] + 1
+# token ids of a book converted to python ints for the automaton at a time
+COUNT_SLICE = 1 << 16
+# trie node keys that can never clash with a stem or stem id
+_FINAL = object()
+_FAIL = object()
+_NEXT_FINAL = object()
 
 
 class dict_trie:
@@ -197,72 +298,167 @@ class dict_trie:
                 else:
                     n = r[k]
                 r = n
-            r["final"] = v
+            r[_FINAL] = v
 
     def find(self, ks):
         r = self.root
         try:
             for k in ks:
                 r = r[k]
-            return r["final"]
+            return r[_FINAL]
         except KeyError as e:
             return None
 
 
+def _children(node):
+    return [(k, v) for k, v in node.items() if type(k) is not object]
+
+
+class dict_automaton(dict_trie):
+    """
+    dict_trie with Aho-Corasick failure links, so every stored stem sequence is
+    found in a word list in one pass, whatever the number of sequences
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.link()
+
+    def link(self):
+        root = self.root
+        queue = deque()
+        for _, child in _children(root):
+            child[_FAIL] = root
+            child[_NEXT_FINAL] = None
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for k, child in _children(node):
+                fail = node[_FAIL]
+                while k not in fail and fail is not root:
+                    fail = fail[_FAIL]
+                fail = fail.get(k, root)
+                child[_FAIL] = fail
+                # closest node on the failure chain that ends a stored sequence
+                child[_NEXT_FINAL] = fail if _FINAL in fail else fail.get(_NEXT_FINAL)
+                queue.append(child)
+
+    def count(self, words, counts, node=None):
+        """
+        Add to counts[v] the number of (possibly overlapping) occurrences in
+        words of every stored sequence with value v
+
+        Args:
+            node    :   state returned by the count of the previous slice, when
+                        words is cut into slices, None to start from scratch
+        Returns:
+            the state after words
+        """
+        root = self.root
+        if node is None:
+            node = root
+        for w in words:
+            while w not in node and node is not root:
+                node = node[_FAIL]
+            node = node.get(w, root)
+            match = node if _FINAL in node else node.get(_NEXT_FINAL)
+            while match is not None:
+                counts[match[_FINAL]] += 1
+                match = match.get(_NEXT_FINAL)
+        return node
+
+
 if __name__ == "__main__":
-    freq_counter = defaultdict(lambda: 0)
-    dic_freq_counter = dict()
-    word_occurences = defaultdict(lambda: [])
-    books = []
-    dicts = [yomi_dict(i).load_words() for i in os.listdir(dic_dir)]
-    print("loaded dicts")
-    for index, i in enumerate(os.listdir("books")):
-        b = book(i, dir="./books")
-        b.load_parse()
-        add_to_count(b.words, freq_counter)
-        for j_index, j in enumerate(b.words):
-            word_occurences[j].append((index, j_index))
-        books.append(b)
-    print("loaded books")
-    for d in dicts:
-        for words, stems in tqdm(zip(d.originals, d.words), total=len(d.words)):
-            word = "".join(words)
-            if word in dic_freq_counter:
-                continue
-            c = 0
-            if stems[0] not in word_occurences:
-                continue
-            for b_id, loc in word_occurences[stems[0]]:
-                has = True
-                for i in range(len(stems)):
-                    if books[b_id].words[loc + i] != stems[i]:
-                        has = False
-                        break
-                if has:
-                    c += 1
-            dic_freq_counter[word] = c
-    for w, f in freq_counter.items():
-        if w not in dic_freq_counter:
-            dic_freq_counter[w] = f
-
-    with open(
-        path.join(freq_dic_dir, "term_meta_bank_1.json"), "w", encoding="utf8"
-    ) as fd:
-        res = [
-            [key, "freq", value]
-            for (key, value) in sorted(
-                dic_freq_counter.items(), key=lambda x: x[1], reverse=True
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "j:t:", ["jobs=", "tokenizer="])
+    except getopt.GetoptError:
+        print(
+            f"{sys.argv[0]} -j <parallel book/dictionary conversions> "
+            "-t <jumanpp|sudachi:B:full|fugashi>"
+        )
+        sys.exit(2)
+
+    jobs = os.cpu_count() or 1
+    for opt, arg in opts:
+        if opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-t", "--tokenizer"):
+            tokenizer_spec = arg
+
+    # the manifest is saved once, when the stages are done (or failed)
+    with manifest:
+        dic_freq_counter = dict()
+        dicts = [yomi_dict(i) for i in os.listdir(dic_dir)]
+        books = [book(i, dir="./books") for i in os.listdir("books")]
+        # dictionaries first, they are needed before any book can be counted
+        jumanpp_pool = JumanppPool(jobs)
+        try:
+            run_stage_chains(
+                [d.pare_text for d in dicts] + [b.parse for b in books], jobs
             )
-            if value > 0
-        ]
-        json.dump(res, fd, ensure_ascii=False)
-    call(["rm", "freq.zip"])
-    call(
-        [
-            "zip",
-            "-j",
-            "freq.zip",
-            path.join(freq_dic_dir, "index.json"),
-            path.join(freq_dic_dir, "term_meta_bank_1.json"),
-        ]
+        finally:
+            jumanpp_pool.close()
+        if jumanpp_pool.start_time is not None:
+            print(jumanpp_pool.report())
+        print("converted books and dicts")
+
+        for d in dicts:
+            d.load_words()
+        print("loaded dicts")
+
+        # stem <-> int id, kept across runs with the token id arrays of the books
+        vocab = Vocabulary(path.join(parse_dir, "vocab.json"))
+        # word -> stem ids of each of its dictionary entries, in dictionary order
+        entries = dict()
+        for d in dicts:
+            for words, stems in zip(d.originals, d.words):
+                word = "".join(words)
+                stem_ids = tuple(vocab.intern(stem) for stem in stems)
+                entries.setdefault(word, []).append(stem_ids)
+        vocab.save()
+        # entries sharing the same stems share a counter
+        sequence_ids = dict()
+        for word_entries in entries.values():
+            for stems in word_entries:
+                sequence_ids.setdefault(stems, len(sequence_ids))
+        automaton = dict_automaton(sequence_ids.items())
+        sequence_counts = [0] * len(sequence_ids)
+        print("built dictionary automaton")
+
+        # occurrences of every stem id, and the ids in order of first appearance
+        stem_counts = np.zeros(len(vocab), dtype=np.int64)
+        seen_ids = dict()
+        for b in tqdm(books):
+            token_ids = b.load_token_ids(vocab)
+            stem_counts = add_counts(stem_counts, token_ids)
+            for i in first_appearance_order(token_ids):
+                seen_ids.setdefault(i, None)
+            # a slice at a time, a list of python ints takes ~7x the int32 array
+            state = None
+            for start in range(0, len(token_ids), COUNT_SLICE):
+                state = automaton.count(
+                    token_ids[start : start + COUNT_SLICE].tolist(),
+                    sequence_counts,
+                    state,
+                )
+            del token_ids
+        print("loaded books")
+
+    for word, word_entries in entries.items():
+        # the first entry whose first stem shows up in the books counts for the
+        # word, later entries still get their turn when an earlier one's doesn't
+        for stems in word_entries:
+            if stems[0] < len(stem_counts) and stem_counts[stems[0]] > 0:
+                dic_freq_counter[word] = sequence_counts[sequence_ids[stems]]
+                break
+    for i in seen_ids:
+        w = vocab.stems[i]
+        if w not in dic_freq_counter:
+            dic_freq_counter[w] = int(stem_counts[i])
+
+    ranked = sorted(dic_freq_counter.items(), key=lambda x: x[1], reverse=True)
+    write_dictionary_zip(
+        "freq.zip",
+        {"title": "Freq", "format": 3, "revision": "frequency1"},
+        ([key, "freq", value] for (key, value) in ranked if value > 0),
     )
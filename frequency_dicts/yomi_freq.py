@@ -2,105 +2,183 @@
 
 import getopt
 import io
-import json
 import os
 import sys
-import zipfile
 from collections import defaultdict
-
-import regex as re
-from epub2txt import epub2txt
-from sudachipy import dictionary, tokenizer
+from itertools import chain
+
+from freq_cache import DEFAULT_CACHE_DIR
+from freq_workers import iter_file_counts
+from jp_tokenizers import DEFAULT_TOKENIZER
+from partial_counts import count_to_partial, merge_partial_counts, parse_shard
+from spill_counts import SpillCounter, ranked_counts
+from term_bank import write_dictionary_zip
+from text_chunks import DEFAULT_CHUNK_BYTES
+from text_sources import iter_sources
+
+
+def freq_from_files(
+    files,
+    jobs=1,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+    cache_dir=DEFAULT_CACHE_DIR,
+    tokenizer=DEFAULT_TOKENIZER,
+    line_cache_bytes=0,
+    max_bytes=0,
+    spill_dir=None,
+    min_count=1,
+    sketch_bytes=0,
+):
+    """
+    Args:
+        jobs    :   number of worker processes, each file is tokenized by one worker
+                    per-file counts are merged in file order, so the result is the
+                    same as a serial run
+        chunk_bytes :   max utf8 size of the text handed to the tokenizer in one call
+        cache_dir   :   per-file count cache, only new/changed files are tokenized
+                        None to always tokenize every file
+        tokenizer   :   jp_tokenizers spec, "sudachi:<A|B|C>:<small|core|full>",
+                        "jumanpp" or "fugashi"
+        line_cache_bytes    :   memory for the memo of tokenized lines (per job),
+                                repeated lines (subtitles) then skip the tokenizer
+                                0 to tokenize whole chunks without memo
+        max_bytes, spill_dir, min_count, sketch_bytes   :   as freq_from_file_counts
+    """
+    return freq_from_file_counts(
+        iter_file_counts(
+            files,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        ),
+        max_bytes=max_bytes,
+        spill_dir=spill_dir,
+        min_count=min_count,
+        sketch_bytes=sketch_bytes,
+    )
 
 
-def freq_from_files(files):
-    CJK_PATTERN = re.compile(
-        r"([\p{IsHan}\p{IsBopo}\p{IsHira}\p{IsKatakana}]+)", re.UNICODE
-    )
-    TOKENIZER = dictionary.Dictionary(dict_type="full").create()
+def freq_from_file_counts(
+    file_counts, max_bytes=0, spill_dir=None, min_count=1, sketch_bytes=0
+):
+    """
+    Args:
+        file_counts :   iterable of (file, {morpheme: count}), from
+                        iter_file_counts or merge_partial_counts
+        max_bytes   :   memory ceiling of the counts, past which they are spilled
+                        to disk (in spill_dir, default the system temp folder)
+                        0 to keep everything in memory
+        min_count   :   morphemes counted fewer times are left out
+        sketch_bytes    :   size of a Count-Min sketch that keeps morphemes out of
+                            memory until they may reach min_count (the counts
+                            are then its estimates, never too low), 0 for exact
+                            counts
+    Returns:
+        {morpheme: count}, or a SpillCounter with max_bytes or sketch_bytes
+    """
+    if max_bytes > 0 or sketch_bytes > 0:
+        freq = SpillCounter(
+            max_bytes or sys.maxsize, spill_dir, min_count, sketch_bytes
+        )
+        for file, file_freq in file_counts:
+            freq.add(file_freq)
+        return freq
 
     freq = defaultdict(int)
-    for i, file in enumerate(files):
-        print(f"{i+1}: processing {os.path.basename(file)}")
-        if file.endswith(".epub"):
-            lines = [
-                line + "。"
-                for content in epub2txt(file, outputlist=True)
-                for line in content.split("。")
-            ]
-        else:
-            lines = open(file, "r", encoding="UTF-8")
-
-        for line in lines:
-            tokens = [
-                morpheme.dictionary_form()
-                for morpheme in TOKENIZER.tokenize(
-                    line, tokenizer.Tokenizer.SplitMode.B
-                )
-            ]
-
-            for token in tokens:
-                if CJK_PATTERN.match(token):
-                    freq[token] += 1
+    for file, file_freq in file_counts:
+        for token, count in file_freq.items():
+            freq[token] += count
+    if min_count > 1:
+        freq = {token: count for token, count in freq.items() if count >= min_count}
     return freq
 
 
 def freq_to_zip(freq, output_file, title, revision):
-    total_number_of_morphemes = len(freq.keys())
-    term_meta_bank = []
-    for index, morpheme in enumerate(sorted(freq, key=freq.get, reverse=True)):
-        num_appearance = freq[morpheme]
-        term_meta_bank.append(
-            [
+    total_number_of_morphemes, ranked = ranked_counts(freq)
+
+    def term_meta_bank():
+        for index, (morpheme, num_appearance) in enumerate(ranked):
+            yield [
                 morpheme,
                 "freq",
                 f"<{num_appearance}>{index + 1}/{total_number_of_morphemes}",
             ]
-        )
 
     index_dict = {"title": title, "format": 3, "revision": f"frequency{revision}"}
-
-    with zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr("index.json", json.dumps(index_dict, ensure_ascii=False))
-        zip_file.writestr(
-            "term_meta_bank_1.json", json.dumps(term_meta_bank, ensure_ascii=False)
-        )
+    write_dictionary_zip(output_file, index_dict, term_meta_bank())
 
 
 def print_help_and_exit():
     print(
-        f"{sys.argv[0]} -t <title in yomichan> -o <output file> -r <revision> input_files"
+        f"{sys.argv[0]} -t <title in yomichan> -o <output file> -r <revision> "
+        "-j <parallel jobs> -c <chunk size in bytes> "
+        "[--cache-dir <dir> | --no-cache] "
+        "[--tokenizer <sudachi:B:full|jumanpp|fugashi>] [--line-cache-mb <MB>] "
+        "[--map <partial file> [--shard <k>/<n>] | --reduce] "
+        "[--max-memory-mb <MB> [--spill-dir <dir>]] "
+        "[--min-count <n> [--sketch-mb <MB>]] "
+        "input_files"
     )
     sys.exit()
 
 
 def main2(argv):
     try:
-        # folder = folder located on the same directory as this script containing all the files (txt and epubs)
-        opts, folder = getopt.getopt(argv, "t:o:r:", ["title=", "output=", "revision="])
+        # folders = folders/files/zips (relative to this script's folder) containing all the files (txt and epubs)
+        opts, folders = getopt.getopt(
+            argv,
+            "t:o:r:j:c:",
+            [
+                "title=",
+                "output=",
+                "revision=",
+                "jobs=",
+                "chunk-bytes=",
+                "cache-dir=",
+                "no-cache",
+                "tokenizer=",
+                "line-cache-mb=",
+                "map=",
+                "shard=",
+                "reduce",
+                "max-memory-mb=",
+                "spill-dir=",
+                "min-count=",
+                "sketch-mb=",
+            ],
+        )
     except getopt.GetoptError:
         sys.exit(2)
 
     curdir = os.path.dirname(os.path.realpath(__file__))
-    subs_dir = os.path.join(curdir, str(folder[0]))
-    files = [os.path.join(subs_dir, filename) for filename in os.listdir(subs_dir)]
-
-    if len(files) > 1000:
-        print("too many files, reduce and try again")
-        print_help_and_exit()
-
-    if len(files) < 1:
+    # listed lazily, folders recursively and sorted, so every machine (and every
+    # --shard) sees the same file order
+    files = iter_sources(os.path.join(curdir, str(folder)) for folder in folders)
+    first_file = next(files, None)
+    if first_file is None:
         print_help_and_exit()
-
-    print(f"processing {len(files)} files")
+    files = chain((first_file,), files)
 
     revision = "1"
-    first_file = files[0]
 
     pathname, extension = os.path.splitext(first_file)
     title = pathname.split("/")[-1]
     output_file = f"{title}.zip"
 
+    jobs = 1
+    chunk_bytes = DEFAULT_CHUNK_BYTES
+    cache_dir = DEFAULT_CACHE_DIR
+    tokenizer = DEFAULT_TOKENIZER
+    line_cache_bytes = 0
+    map_file = None
+    shard = None
+    reduce = False
+    max_bytes = 0
+    spill_dir = None
+    min_count = 1
+    sketch_bytes = 0
     for opt, arg in opts:
         if opt == "-h":
             print_help_and_exit()
@@ -110,28 +188,125 @@ def main2(argv):
             output_file = arg
         elif opt in ("-r", "--revision"):
             revision = arg
-
-    freq = freq_from_files(files)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-c", "--chunk-bytes"):
+            chunk_bytes = int(arg)
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--no-cache":
+            cache_dir = None
+        elif opt == "--tokenizer":
+            tokenizer = arg
+        elif opt == "--line-cache-mb":
+            line_cache_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--map":
+            map_file = arg
+        elif opt == "--shard":
+            shard = parse_shard(arg)
+        elif opt == "--reduce":
+            reduce = True
+        elif opt == "--max-memory-mb":
+            max_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--spill-dir":
+            spill_dir = arg
+        elif opt == "--min-count":
+            min_count = int(arg)
+        elif opt == "--sketch-mb":
+            sketch_bytes = int(float(arg) * 1024 * 1024)
+
+    if shard is not None and map_file is None:
+        print("--shard only goes with --map")
+        print_help_and_exit()
+    if map_file is not None:
+        count_to_partial(
+            map_file,
+            files,
+            shard,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
+        print(f"wrote partial counts to {map_file}")
+        return
+    if reduce:
+        freq = freq_from_file_counts(
+            merge_partial_counts(files),
+            max_bytes=max_bytes,
+            spill_dir=spill_dir,
+            min_count=min_count,
+            sketch_bytes=sketch_bytes,
+        )
+    else:
+        freq = freq_from_files(
+            files,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+            max_bytes=max_bytes,
+            spill_dir=spill_dir,
+            min_count=min_count,
+            sketch_bytes=sketch_bytes,
+        )
     print("creating zip file....")
     freq_to_zip(freq, output_file, title, revision)
 
 
 def main(argv):
     try:
-        opts, files = getopt.getopt(argv, "t:o:r:", ["title=", "output=", "revision="])
+        opts, files = getopt.getopt(
+            argv,
+            "t:o:r:j:c:",
+            [
+                "title=",
+                "output=",
+                "revision=",
+                "jobs=",
+                "chunk-bytes=",
+                "cache-dir=",
+                "no-cache",
+                "tokenizer=",
+                "line-cache-mb=",
+                "map=",
+                "shard=",
+                "reduce",
+                "max-memory-mb=",
+                "spill-dir=",
+                "min-count=",
+                "sketch-mb=",
+            ],
+        )
     except getopt.GetoptError:
         sys.exit(2)
 
-    if len(files) < 1:
+    files = iter_sources(files)
+    first_file = next(files, None)
+    if first_file is None:
         print_help_and_exit()
+    files = chain((first_file,), files)
 
     revision = "1"
-    first_file = files[0]
 
     pathname, extension = os.path.splitext(first_file)
     title = pathname.split("/")[-1]
     output_file = f"{title}.zip"
 
+    jobs = 1
+    chunk_bytes = DEFAULT_CHUNK_BYTES
+    cache_dir = DEFAULT_CACHE_DIR
+    tokenizer = DEFAULT_TOKENIZER
+    line_cache_bytes = 0
+    map_file = None
+    shard = None
+    reduce = False
+    max_bytes = 0
+    spill_dir = None
+    min_count = 1
+    sketch_bytes = 0
     for opt, arg in opts:
         if opt == "-h":
             print_help_and_exit()
@@ -141,8 +316,70 @@ def main(argv):
             output_file = arg
         elif opt in ("-r", "--revision"):
             revision = arg
-
-    freq = freq_from_files(files)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-c", "--chunk-bytes"):
+            chunk_bytes = int(arg)
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--no-cache":
+            cache_dir = None
+        elif opt == "--tokenizer":
+            tokenizer = arg
+        elif opt == "--line-cache-mb":
+            line_cache_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--map":
+            map_file = arg
+        elif opt == "--shard":
+            shard = parse_shard(arg)
+        elif opt == "--reduce":
+            reduce = True
+        elif opt == "--max-memory-mb":
+            max_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--spill-dir":
+            spill_dir = arg
+        elif opt == "--min-count":
+            min_count = int(arg)
+        elif opt == "--sketch-mb":
+            sketch_bytes = int(float(arg) * 1024 * 1024)
+
+    if shard is not None and map_file is None:
+        print("--shard only goes with --map")
+        print_help_and_exit()
+    if map_file is not None:
+        count_to_partial(
+            map_file,
+            files,
+            shard,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
+        print(f"wrote partial counts to {map_file}")
+        return
+    if reduce:
+        freq = freq_from_file_counts(
+            merge_partial_counts(files),
+            max_bytes=max_bytes,
+            spill_dir=spill_dir,
+            min_count=min_count,
+            sketch_bytes=sketch_bytes,
+        )
+    else:
+        freq = freq_from_files(
+            files,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+            max_bytes=max_bytes,
+            spill_dir=spill_dir,
+            min_count=min_count,
+            sketch_bytes=sketch_bytes,
+        )
     freq_to_zip(freq, output_file, title, revision)
 
 
@@ -170,6 +407,28 @@ if __name__ == "__main__":
 # folder use:
 # python yomifreq.py -t oregairu -o oregairu.zip Yahari
 # python yomifreq.py -t DTB -o dtb.zip Darker_Than_Black
+# folders are read recursively, with .gz/.bz2/.xz/.zst (pip install zstandard) files and
+# the members of .zip subtitle packs read in place, without unpacking them:
+# python yomifreq.py -t Subs -o subs.zip subtitles/ more_subs.zip extra.txt.xz
+
+# parallel use (one sudachi tokenizer per worker process, same output as a serial run):
+# python yomifreq.py -j 32 -t DTB -o dtb.zip Darker_Than_Black
+
+# other tokenizers (python jp_tokenizers.py <files> compares their speed and memory):
+# python yomifreq.py --tokenizer sudachi:C:core -t DTB -o dtb.zip Darker_Than_Black
+
+# subtitle folders repeat the same lines a lot, a line memo tokenizes each distinct line once:
+# python yomifreq.py --line-cache-mb 256 -t DTB -o dtb.zip Darker_Than_Black
+
+# several machines (same tokenizer versions): each counts one shard into a partial file,
+# then the copied partial files are merged (same zip as a single-machine run):
+# python yomifreq.py --map part1.gz --shard 1/3 Darker_Than_Black   (machine 1, 2/3 and 3/3 elsewhere)
+# python yomifreq.py --reduce -t DTB -o dtb.zip part1.gz part2.gz part3.gz
+
+# corpora whose vocabulary doesn't fit in memory: counts past 4GB are spilled to disk,
+# and (optionally) morphemes seen fewer than 3 times are left out, a 512MB sketch keeping
+# them out of memory altogether:
+# python yomifreq.py --max-memory-mb 4096 --spill-dir /scratch --min-count 3 --sketch-mb 512 -t Web -o web.zip web/
 
 
 # my uses: (OLDER USE, deprecated!)
@@ -2,176 +2,163 @@
 
 import getopt
 import io
-import json
 import math
 import os
 import sys
-import zipfile
-from collections import defaultdict
-
-import regex as re
-from epub2txt import epub2txt
-from sudachipy import dictionary, tokenizer
-
-
-def freq_from_files(files, weighted=True):
-    CJK_PATTERN = re.compile(
-        r"([\p{IsHan}\p{IsBopo}\p{IsHira}\p{IsKatakana}]+)", re.UNICODE
+from itertools import chain
+
+from freq_cache import DEFAULT_CACHE_DIR
+from freq_weighting import WEIGHTING_SCHEMES, TermDocCounts, weigh
+from freq_workers import iter_file_counts
+from jp_tokenizers import DEFAULT_TOKENIZER
+from partial_counts import count_to_partial, merge_partial_counts, parse_shard
+from term_bank import write_dictionary_zip
+from text_chunks import DEFAULT_CHUNK_BYTES
+from text_sources import iter_sources
+
+
+def freq_from_files(
+    files,
+    weighted=True,
+    scheme="remap",
+    jobs=1,
+    chunk_bytes=DEFAULT_CHUNK_BYTES,
+    cache_dir=DEFAULT_CACHE_DIR,
+    tokenizer=DEFAULT_TOKENIZER,
+    line_cache_bytes=0,
+):
+    """
+    Args:
+        weighted    :   False to skip weighting (same as scheme="none")
+        scheme      :   how counts are weighted by their spread over the books
+                        (see freq_weighting.WEIGHTING_SCHEMES), "remap" is the
+                        original 0.4 - 1.5 document-frequency multiplier
+        jobs    :   number of worker processes, each file is tokenized by one worker
+                    per-file counts are merged in file order, so the result is the
+                    same as a serial run
+        chunk_bytes :   max utf8 size of the text handed to the tokenizer in one call
+        cache_dir   :   per-file count cache, only new/changed files are tokenized
+                        None to always tokenize every file
+        tokenizer   :   jp_tokenizers spec, "sudachi:<A|B|C>:<small|core|full>",
+                        "jumanpp" or "fugashi"
+        line_cache_bytes    :   memory for the memo of tokenized lines (per job),
+                                repeated lines (subtitles) then skip the tokenizer
+                                0 to tokenize whole chunks without memo
+    """
+    return freq_from_file_counts(
+        iter_file_counts(
+            files,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        ),
+        weighted=weighted,
+        scheme=scheme,
     )
-    TOKENIZER = dictionary.Dictionary(dict_type="full").create()
-
-    book_names_list = []
-    per_book_freq = dict()
 
-    freq = defaultdict(int)
-    for i, file in enumerate(files):
-        base_filename = os.path.basename(file)
-        book_names_list.append(base_filename)
-        print(f"{i+1}: processing {base_filename}")
 
-        # {
+def freq_from_file_counts(file_counts, weighted=True, scheme="remap"):
+    """
+    Args:
+        file_counts :   iterable of (file, {morpheme: count}), from
+                        iter_file_counts or merge_partial_counts
+        weighted, scheme    :   as freq_from_files
+    """
+    term_doc = TermDocCounts()
+    for file, file_freq in file_counts:
+        # one matrix column per book
         #   'book1': {'の': 2000, 'だ': 1000, 'は': 500.....},
         #   'book2': {'の': 1500, 'だ': 900, 'は': 500.....},
-        # }
-        per_book_freq[base_filename] = dict()
-
-        if file.endswith(".epub"):
-            lines = [
-                line + "。"
-                for content in epub2txt(file, outputlist=True)
-                for line in content.split("。")
-            ]
-        else:
-            lines = open(file, "r", encoding="UTF-8")
-
-        for line in lines:
-            tokens = [
-                morpheme.dictionary_form()
-                for morpheme in TOKENIZER.tokenize(
-                    line, tokenizer.Tokenizer.SplitMode.B
-                )
-            ]
+        term_doc.add_document(file_freq)
 
-            for token in tokens:
-                per_book_freq[base_filename][token] = 0
-
-            for token in tokens:
-                if CJK_PATTERN.match(token):
-                    freq[token] += 1
-                    per_book_freq[base_filename][token] += 1  # my code
-
-    # my code::
-    if weighted:
-        for morpheme in freq:
-            weight_counter = 0
-            for book in book_names_list:
-                freq_in_book: dict = per_book_freq.get(book)
-                freq_in_book = freq_in_book.get(
-                    morpheme, 0
-                )  # gets the freq of the morpheme inside the particular book, else 0
-                if freq_in_book > 0:
-                    weight_counter += 1
-
-            # normalize to a range from (0 to 1)
-            multiplier = weight_counter / len(book_names_list)
-            old_multiplier = multiplier
-
-            # remap to another range (0.8 to 1.2)
-            min_range = 0.4
-            max_range = 1.5
-            distance = max_range - min_range
-            multiplier = (multiplier * distance) + min_range
-
-            new_freq = 0
-
-            new_freq = freq[morpheme] * multiplier
-            freq[morpheme] = new_freq
-            # for book in book_names_list:
-            #     freq_in_book: dict = per_book_freq.get(book)
-            #     freq_in_book = freq_in_book.get(morpheme, 0)  # gets the freq of the morpheme inside the particular book, else 0
-            #
-            #     new_freq = (new_freq + freq_in_book)*multiplier
-            #
-            # max_size_to_original = 2  # max of how many times larger it can be than its original freq
-            # min_size_to_original = 0.3
-            #
-            # # final value for new_freq (make sure it doesn't grow too far(high/low) from its original value)
-            # if freq[morpheme] < 2000:
-            #     if new_freq >= freq[morpheme]*max_size_to_original:
-            #         new_freq = freq[morpheme]*max_size_to_original
-            #     elif new_freq <= freq[morpheme]*min_size_to_original:
-            #         new_freq = freq[morpheme]*min_size_to_original
-            # else:
-            #     new_freq = freq[morpheme]
-            #
-            # # store the new, normalized (based on frequency across diff books) frequency
-            # freq[morpheme] = new_freq
-
-    else:
-        pass
+    if not weighted:
+        scheme = "none"
 
-    return freq
+    return weigh(term_doc, scheme)
 
 
 def freq_to_zip(freq, output_file, title, revision):
     total_number_of_morphemes = len(freq.keys())
-    term_meta_bank = []
-    for index, morpheme in enumerate(sorted(freq, key=freq.get, reverse=True)):
-        num_appearance = freq[morpheme]
-        term_meta_bank.append(
-            [
+    ranked = sorted(freq, key=freq.get, reverse=True)
+
+    def term_meta_bank():
+        for index, morpheme in enumerate(ranked):
+            num_appearance = freq[morpheme]
+            yield [
                 morpheme,
                 "freq",
                 f"<{math.ceil(num_appearance)}>{index + 1}/{total_number_of_morphemes}",
             ]
-        )
 
     index_dict = {"title": title, "format": 3, "revision": f"frequency{revision}"}
-
-    with zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr("index.json", json.dumps(index_dict, ensure_ascii=False))
-        zip_file.writestr(
-            "term_meta_bank_1.json", json.dumps(term_meta_bank, ensure_ascii=False)
-        )
+    write_dictionary_zip(output_file, index_dict, term_meta_bank())
 
 
 def print_help_and_exit():
     print(
-        f"{sys.argv[0]} -t <title in yomichan> -o <output file> -r <revision> input_files"
+        f"{sys.argv[0]} -t <title in yomichan> -o <output file> -r <revision> "
+        "-j <parallel jobs> -c <chunk size in bytes> "
+        "[--cache-dir <dir> | --no-cache] "
+        "[--tokenizer <sudachi:B:full|jumanpp|fugashi>] [--line-cache-mb <MB>] "
+        "[--map <partial file> [--shard <k>/<n>] | --reduce] "
+        f"-s <{'|'.join(WEIGHTING_SCHEMES)}> input_files"
     )
     sys.exit()
 
 
 def main2(argv):
     try:
-        # folder = folder located on the same directory as this script containing all the files (txt and epubs)
-        opts, folder = getopt.getopt(
-            argv, "t:o:r:w", ["title=", "output=", "revision=", "weighted="]
+        # folders = folders/files/zips (relative to this script's folder) containing all the files (txt and epubs)
+        opts, folders = getopt.getopt(
+            argv,
+            "t:o:r:wj:c:s:",
+            [
+                "title=",
+                "output=",
+                "revision=",
+                "weighted=",
+                "jobs=",
+                "chunk-bytes=",
+                "cache-dir=",
+                "no-cache",
+                "tokenizer=",
+                "line-cache-mb=",
+                "map=",
+                "shard=",
+                "reduce",
+                "scheme=",
+            ],
         )
     except getopt.GetoptError:
         sys.exit(2)
 
     curdir = os.path.dirname(os.path.realpath(__file__))
-    subs_dir = os.path.join(curdir, str(folder[0]))
-    files = [os.path.join(subs_dir, filename) for filename in os.listdir(subs_dir)]
-
-    if len(files) > 1000:
-        print("too many files, reduce and try again")
+    # listed lazily, folders recursively and sorted, so every machine (and every
+    # --shard) sees the same file order
+    files = iter_sources(os.path.join(curdir, str(folder)) for folder in folders)
+    first_file = next(files, None)
+    if first_file is None:
         print_help_and_exit()
-
-    if len(files) < 1:
-        print_help_and_exit()
-
-    print(f"processing {len(files)} files")
+    files = chain((first_file,), files)
 
     revision = "1"
-    first_file = files[0]
 
     pathname, extension = os.path.splitext(first_file)
     title = pathname.split("/")[-1]
     output_file = f"{title}.zip"
 
     weighted = True
+    jobs = 1
+    chunk_bytes = DEFAULT_CHUNK_BYTES
+    cache_dir = DEFAULT_CACHE_DIR
+    tokenizer = DEFAULT_TOKENIZER
+    line_cache_bytes = 0
+    map_file = None
+    shard = None
+    reduce = False
+    scheme = "remap"
     for opt, arg in opts:
         if opt == "-h":
             print_help_and_exit()
@@ -181,32 +168,111 @@ def main2(argv):
             output_file = arg
         elif opt in ("-r", "--revision"):
             revision = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-c", "--chunk-bytes"):
+            chunk_bytes = int(arg)
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--no-cache":
+            cache_dir = None
+        elif opt == "--tokenizer":
+            tokenizer = arg
+        elif opt == "--line-cache-mb":
+            line_cache_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--map":
+            map_file = arg
+        elif opt == "--shard":
+            shard = parse_shard(arg)
+        elif opt == "--reduce":
+            reduce = True
+        elif opt in ("-s", "--scheme"):
+            scheme = arg
         elif opt in ("-w", "--weighted"):
             weighted = False
 
-    print(f"weighted mode?: {weighted}")
+    print(f"weighted mode?: {weighted}, scheme: {scheme}")
 
-    freq = freq_from_files(files, weighted=weighted)
+    if shard is not None and map_file is None:
+        print("--shard only goes with --map")
+        print_help_and_exit()
+    if map_file is not None:
+        count_to_partial(
+            map_file,
+            files,
+            shard,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
+        print(f"wrote partial counts to {map_file}")
+        return
+    if reduce:
+        freq = freq_from_file_counts(
+            merge_partial_counts(files), weighted=weighted, scheme=scheme
+        )
+    else:
+        freq = freq_from_files(
+            files,
+            weighted=weighted,
+            scheme=scheme,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
     print("creating zip file....")
     freq_to_zip(freq, output_file, title, revision)
 
 
 def main(argv):
     try:
-        opts, files = getopt.getopt(argv, "t:o:r:", ["title=", "output=", "revision="])
+        opts, files = getopt.getopt(
+            argv,
+            "t:o:r:j:c:s:",
+            [
+                "title=",
+                "output=",
+                "revision=",
+                "jobs=",
+                "chunk-bytes=",
+                "cache-dir=",
+                "no-cache",
+                "tokenizer=",
+                "line-cache-mb=",
+                "map=",
+                "shard=",
+                "reduce",
+                "scheme=",
+            ],
+        )
     except getopt.GetoptError:
         sys.exit(2)
 
-    if len(files) < 1:
+    files = iter_sources(files)
+    first_file = next(files, None)
+    if first_file is None:
         print_help_and_exit()
+    files = chain((first_file,), files)
 
     revision = "1"
-    first_file = files[0]
 
     pathname, extension = os.path.splitext(first_file)
     title = pathname.split("/")[-1]
     output_file = f"{title}.zip"
 
+    jobs = 1
+    chunk_bytes = DEFAULT_CHUNK_BYTES
+    cache_dir = DEFAULT_CACHE_DIR
+    tokenizer = DEFAULT_TOKENIZER
+    line_cache_bytes = 0
+    map_file = None
+    shard = None
+    reduce = False
+    scheme = "remap"
     for opt, arg in opts:
         if opt == "-h":
             print_help_and_exit()
@@ -216,8 +282,55 @@ def main(argv):
             output_file = arg
         elif opt in ("-r", "--revision"):
             revision = arg
-
-    freq = freq_from_files(files)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-c", "--chunk-bytes"):
+            chunk_bytes = int(arg)
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--no-cache":
+            cache_dir = None
+        elif opt == "--tokenizer":
+            tokenizer = arg
+        elif opt == "--line-cache-mb":
+            line_cache_bytes = int(float(arg) * 1024 * 1024)
+        elif opt == "--map":
+            map_file = arg
+        elif opt == "--shard":
+            shard = parse_shard(arg)
+        elif opt == "--reduce":
+            reduce = True
+        elif opt in ("-s", "--scheme"):
+            scheme = arg
+
+    if shard is not None and map_file is None:
+        print("--shard only goes with --map")
+        print_help_and_exit()
+    if map_file is not None:
+        count_to_partial(
+            map_file,
+            files,
+            shard,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
+        print(f"wrote partial counts to {map_file}")
+        return
+    if reduce:
+        freq = freq_from_file_counts(merge_partial_counts(files), scheme=scheme)
+    else:
+        freq = freq_from_files(
+            files,
+            scheme=scheme,
+            jobs=jobs,
+            chunk_bytes=chunk_bytes,
+            cache_dir=cache_dir,
+            tokenizer=tokenizer,
+            line_cache_bytes=line_cache_bytes,
+        )
     freq_to_zip(freq, output_file, title, revision)
 
 
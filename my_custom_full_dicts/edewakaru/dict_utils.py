@@ -1,11 +1,14 @@
-import json
 import os
-import pathlib
-import shutil
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+from yomi_writer import write_yomichan_zip  # noqa: E402
 
 
 def create_dictionary(
-    final_list: list,
+    final_list,
     terms_per_file: int,
     debug: bool,
     build_version: str,
@@ -19,7 +22,8 @@ def create_dictionary(
     Create yomichan json files and zip them to an archive
 
     Args:
-        final_list      :   final list of words and definitions in yomichan format
+        final_list      :   iterable of words and definitions in yomichan format
+                            (a generator is fine, only one term bank is kept in memory)
         terms_per_file  :   num of max terms per term_bank.json
         debug           :   True if currently testing, False for final builds
         build_version   :   version control
@@ -27,45 +31,17 @@ def create_dictionary(
         test_name       :   test name to be appended (e.g. TEST0)
     """
     print("creating dictionary")
-    build_version = build_version
-
-    if debug:
-        test_name = test_name
-
-    build_directory = f"yomichan_dictionary_json_files_{build_version}{test_name}"
-    try:
-        os.mkdir(build_directory)
-    except FileExistsError:
-        print("directory already exists")
-
-    terms_per_file = terms_per_file
-    max_i = int(len(final_list) / terms_per_file) + 1
-    for i in range(max_i):
-        if pathlib.Path(f"{build_directory}/term_bank{i+1}.json").is_file():
-            os.remove(f"{build_directory}/term_bank{i+1}.json")
-
-        with open(
-            f"{build_directory}/term_bank_{i+1}.json", "w", encoding="utf8"
-        ) as f_out:
-            start = terms_per_file * i
-            end = terms_per_file * (i + 1)
-            print(f"creating term_bank_{i+1}.json")
-            json.dump(final_list[start:end], f_out, indent=4, ensure_ascii=False)
-
-        with open(f"{build_directory}/index.json", "w", encoding="utf8") as f:
-            index = {
-                "title": f"{dict_name}{test_name}",
-                "revision": f"{dict_revision}.{build_version}",
-                "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
-                "sequenced": True,
-                "format": 3,
-                "description": f"{dict_description}",
-                "attribution": f"{dict_attribution}",
-                "author": "nihongobongo",
-            }
-            json.dump(index, f, indent=4, ensure_ascii=False)
 
-        zip_filename = f"[Grammar] {dict_name}{build_version}{test_name}"
-        if pathlib.Path(f"{zip_filename}.zip").is_file():
-            os.remove(f"{zip_filename}.zip")
-        shutil.make_archive(f"{zip_filename}", "zip", build_directory)
+    index = {
+        "title": f"{dict_name}{test_name}",
+        "revision": f"{dict_revision}.{build_version}",
+        "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
+        "sequenced": True,
+        "format": 3,
+        "description": f"{dict_description}",
+        "attribution": f"{dict_attribution}",
+        "author": "nihongobongo",
+    }
+
+    zip_filename = f"[Grammar] {dict_name}{build_version}{test_name}"
+    write_yomichan_zip(final_list, f"{zip_filename}.zip", index, terms_per_file)
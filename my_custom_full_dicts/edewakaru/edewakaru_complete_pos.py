@@ -11,7 +11,6 @@ def main():
         data_in: list = json.load(f_in)
 
     for idx, line in enumerate(data_in):
-        jp_utils.create_foosoft_pos_map()
         yomi_pos = jp_utils.get_foosoft_pos(line[0])
         data_in[idx][3] = yomi_pos
 
@@ -1,9 +1,14 @@
-import json
-from collections import OrderedDict
+import os
+import sys
 
 import jaconv
 from sudachipy import dictionary, tokenizer
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+from deinflect_rules import load_deinflect_rules  # noqa: E402
+
 
 def generate_reading(text: str) -> str:
     """
@@ -20,18 +25,6 @@ def generate_reading(text: str) -> str:
     return aggr
 
 
-def _return_item_that_endswith(word: str, lookup):
-    """
-    https://stackoverflow.com/questions/48774616/return-the-value-of-a-matching-item-in-a-python-list
-    Args:
-        word    : word to check if it's somewhere inside the lookup tuple
-        lookup  : deinflection endings tuple
-    Returns:
-        the ending of the word (that matched)
-    """
-    return next((s for s in lookup if word.endswith(s)), None)
-
-
 def get_matching_item_from_list(iterable, text_to_match: str):
     """
     https://stackoverflow.com/questions/48774616/return-the-value-of-a-matching-item-in-a-python-list
@@ -41,44 +34,12 @@ def get_matching_item_from_list(iterable, text_to_match: str):
     return next((member for member in iterable if text_to_match in member.text), None)
 
 
-def create_foosoft_pos_map() -> None:
-    """
-    based on foosoft's deinflect.json
-    """
-    inflection_endings = []
-    with open("deinflect.json", "r", encoding="utf8") as ff:
-        deinflect = json.load(ff)
-
-    global FOOSOFT_POS_MAP
-    FOOSOFT_POS_MAP = OrderedDict()
-
-    for rule in deinflect:
-        inflection_endings.append(rule["kanaIn"])
-        FOOSOFT_POS_MAP[rule["kanaIn"]] = rule["rulesIn"]
-
-    with open("deinflect2.json", "r", encoding="utf8") as fh:
-        deinflect2 = json.load(fh)
-
-    for rule in deinflect2:
-        inflection_endings.append(rule["kanaOut"])
-        FOOSOFT_POS_MAP[rule["kanaOut"]] = rule["rulesOut"]
-
-    global INFLECTIONS
-    INFLECTIONS = tuple(inflection_endings)
-
-
 def get_foosoft_pos(word) -> str:
     """
     Returns:
          yomichan pos (e.g. v1, vk)
     """
-    ending = _return_item_that_endswith(word, INFLECTIONS)
-
-    yomi_pos = FOOSOFT_POS_MAP.get(ending, "")
-    if yomi_pos:
-        yomi_pos = yomi_pos[0]
-
-    return yomi_pos
+    return load_deinflect_rules().get_pos(word)
 
 
 if __name__ == "__main__":
@@ -1,39 +1,18 @@
-import random
-import time
-import urllib.request
+import os
+import sys
 from html.parser import HTMLParser
 from io import StringIO
 
 from bs4 import BeautifulSoup
 from css_parser import parseStyle
 
-# text processing, html and website utils
-
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+# re-exported, the scrapers import it from here
+from http_fetch import try_access_site  # noqa: E402, F401
 
-def try_access_site(site, sleep_time=0.08, num_retries=3, wait_time=15.0, timeout=5):
-    initial_time = time.time()
-    time_margin = 0.02
-
-    response = None
-    try:
-        response = urllib.request.urlopen(site, timeout=timeout)
-
-    except:
-        for i in range(num_retries):
-            lapsed_time = time.time()
-            if lapsed_time - initial_time > wait_time:
-                return None
-
-            try:
-                response = urllib.request.urlopen(site, timeout=timeout)
-            except:
-                # does something like random.uniform(0.06, 0.10)
-                sleep_time = random.uniform(
-                    sleep_time - time_margin, sleep_time + time_margin
-                )
-                time.sleep(sleep_time)
-    finally:
-        return response
+# text processing, html and website utils
 
 
 class MLStripper(HTMLParser):
@@ -1,13 +1,16 @@
 import csv
-import json
 import os
-import pathlib
 import re
-import shutil
+import sys
 
 import util
 from bs4 import BeautifulSoup
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+from yomi_writer import write_yomichan_zip  # noqa: E402
+
 cleaned_input = []
 
 with open("ssd-h-rmv.csv", "r", encoding="utf8") as f_in:
@@ -171,47 +174,24 @@ for i, entry in enumerate(cleaned_input):
 def create_sanseido():
     build_version = "v_1.01"
 
-    build_directory = "yomichan_dictionary_json_files"
-    try:
-        os.mkdir(build_directory)
-    except FileExistsError:
-        print("directory already exists")
-
     terms_per_file = 10000
-    max_i = int(len(final_ouput) / terms_per_file) + 1
-    for i in range(max_i):
-        if pathlib.Path(f"{build_directory}/term_bank{i+1}.json").is_file():
-            os.remove(f"{build_directory}/term_bank{i+1}.json")
-
-        with open(
-            f"{build_directory}/term_bank_{i+1}.json", "w", encoding="utf8"
-        ) as f_out:
-            start = terms_per_file * i
-            end = terms_per_file * (i + 1)
-            print(i)
-            json.dump(final_ouput[start:end], f_out, indent=4, ensure_ascii=False)
-
-    with open(f"{build_directory}/index.json", "w", encoding="utf8") as f:
-        index = {
-            "title": "三省堂国語辞典 第7版",
-            "revision": f"sanseido7.{build_version}",
-            "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
-            "sequenced": True,
-            "format": 3,
-            "description": """生きのよい国語辞典『三国(サンコク)』の全面改訂版。\n\nカタカナ語から生活のことばまで約4千語を追加。\n
+    index = {
+        "title": "三省堂国語辞典 第7版",
+        "revision": f"sanseido7.{build_version}",
+        "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
+        "sequenced": True,
+        "format": 3,
+        "description": """生きのよい国語辞典『三国(サンコク)』の全面改訂版。\n\nカタカナ語から生活のことばまで約4千語を追加。\n
                             シンプルで平易な語釈によって現代語を活写する。\n類書にない項目(「スイスロール」等)や
                             最新の知見(新語・新用法の発生・普及年代を示す、「銀ぶら」の民間語源を正す)も満載。\n話しことばに〔話〕のラベルを新表示。
                             \n知らないと困る社会常識語約3千2百を新たに選定。\n新常用漢字表対応。並版を拡大し、文字サイズ約106%に。
                             \n項目数約8万2千。2色刷。""",
-            "attribution": "https://www.monokakido.jp/ja/old_product/japanese/sankoku7/",
-            "author": "nihongobongo",
-        }
-        json.dump(index, f, indent=4, ensure_ascii=False)
+        "attribution": "https://www.monokakido.jp/ja/old_product/japanese/sankoku7/",
+        "author": "nihongobongo",
+    }
 
     zip_filename = "[Monolingual]三省堂国語辞典 第7版"
-    if pathlib.Path(f"{zip_filename}_{build_version}.zip").is_file():
-        os.remove(f"{zip_filename}.zip")
-    shutil.make_archive(zip_filename, "zip", build_directory)
+    write_yomichan_zip(final_ouput, f"{zip_filename}.zip", index, terms_per_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+
+from suffix_index import SuffixIndex
+
+# bump when the compiled (pickled) layout changes
+CACHE_VERSION = "1"
+
+
+class DeinflectRules:
+    """
+    Read-only ending -> yomichan rules lookup built from foosoft's deinflect.json
+    (kanaIn : rulesIn) and deinflect2.json (kanaOut : rulesOut)
+
+    Get one through load_deinflect_rules() instead of constructing it directly,
+    so every builder in the process shares the same parsed rules.
+    """
+
+    __slots__ = ("_index",)
+
+    def __init__(self, index: SuffixIndex):
+        object.__setattr__(self, "_index", index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DeinflectRules is read-only")
+
+    def get_rules(self, word: str) -> tuple:
+        """
+        Returns:
+            all yomichan rules of the longest matching ending (e.g. ('v1', 'v5'))
+        """
+        return self._index.get(word, tuple())
+
+    def get_pos(self, word: str) -> str:
+        """
+        Returns:
+            yomichan pos (e.g. v1, vk), empty string if no ending matched
+        """
+        rules = self.get_rules(word)
+        if rules:
+            return rules[0]
+        return ""
+
+    def endswith(self, word: str) -> bool:
+        return self._index.endswith(word)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def _hash_rule_files(paths) -> str:
+    sha = hashlib.sha256(CACHE_VERSION.encode("utf8"))
+    for file_path in paths:
+        with open(file_path, "rb") as fh:
+            sha.update(fh.read())
+    return sha.hexdigest()
+
+
+def _compile_rules(deinflect_path: str, deinflect2_path: str) -> SuffixIndex:
+    index = SuffixIndex()
+
+    with open(deinflect_path, "r", encoding="utf8") as ff:
+        deinflect = json.load(ff)
+
+    for rule in deinflect:
+        index.add(rule["kanaIn"], tuple(rule["rulesIn"]))
+
+    with open(deinflect2_path, "r", encoding="utf8") as fh:
+        deinflect2 = json.load(fh)
+
+    for rule in deinflect2:
+        index.add(rule["kanaOut"], tuple(rule["rulesOut"]))
+
+    return index
+
+
+@functools.lru_cache(maxsize=None)
+def load_deinflect_rules(rule_dir: str = ".", use_disk_cache: bool = True):
+    """
+    Parse deinflect.json and deinflect2.json once per process
+    The compiled index is also pickled next to the rule files, keyed by the hash
+    of both files, so later runs skip the json parsing entirely
+
+    Args:
+        rule_dir        :   directory containing deinflect.json and deinflect2.json
+        use_disk_cache  :   False to always parse the json files
+    Returns:
+        a shared, read-only DeinflectRules
+    """
+    deinflect_path = os.path.join(rule_dir, "deinflect.json")
+    deinflect2_path = os.path.join(rule_dir, "deinflect2.json")
+
+    if not use_disk_cache:
+        return DeinflectRules(_compile_rules(deinflect_path, deinflect2_path))
+
+    digest = _hash_rule_files((deinflect_path, deinflect2_path))
+    cache_path = os.path.join(rule_dir, f".deinflect_rules.{digest[:16]}.pickle")
+
+    try:
+        with open(cache_path, "rb") as fh:
+            return DeinflectRules(pickle.load(fh))
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    index = _compile_rules(deinflect_path, deinflect2_path)
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as fh:
+            pickle.dump(index, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        print("could not write the deinflection rule cache")
+
+    return DeinflectRules(index)
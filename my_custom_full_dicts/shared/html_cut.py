@@ -0,0 +1,159 @@
+import re
+
+# a comment, or a start/end tag (group 1: "/" for end tags, group 2: tag name)
+TAG_PATTERN = re.compile(r"<!--.*?-->|<(/?)([A-Za-z][A-Za-z0-9]*)\b[^>]*>", re.S)
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "meta", "wbr"}
+
+# start tags that end an open <p> without its end tag
+P_CLOSERS = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "div",
+    "dl",
+    "fieldset",
+    "figure",
+    "footer",
+    "form",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hr",
+    "main",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "ul",
+}
+# an implied end doesn't reach past these
+SCOPE_TAGS = {"button", "caption", "html", "table", "td", "th"}
+
+
+def first_sections(text, separator, count) -> list:
+    """
+    The first count items of split_but_keep_separator(text, separator), without
+    splitting the rest of text
+    """
+    sections = []
+    start = 0
+    while len(sections) < count and start <= len(text):
+        end = text.find(separator, start)
+        if end == -1:
+            end = len(text)
+        if end > start:
+            sections.append(text[start:end] + separator)
+        start = end + len(separator)
+    return sections
+
+
+def _close_tag(stack, name) -> bool:
+    """
+    Pop name (and the elements left open inside it) off a stack of
+    (tag name, start position)
+
+    Returns:
+        False if name isn't open
+    """
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == name:
+            del stack[i:]
+            return True
+    return False
+
+
+def _implied_ends(stack, name) -> None:
+    """
+    Pop the elements a start tag of name ends without their end tags, as html
+    parsers do: an open <p> before a block, <li> before <li>, <dt>/<dd> before
+    <dt>/<dd>
+    """
+    if name in P_CLOSERS:
+        closed, scope = {"p"}, SCOPE_TAGS
+    elif name == "li":
+        closed, scope = {"li"}, SCOPE_TAGS | {"ol", "ul"}
+    elif name in ("dt", "dd"):
+        closed, scope = {"dt", "dd"}, SCOPE_TAGS | {"dl"}
+    else:
+        return
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] in closed:
+            del stack[i:]
+            return
+        if stack[i][0] in scope:
+            return
+
+
+def limit_terms(html, terms_limit, separator) -> str:
+    """
+    Keep at most terms_limit terms (links outside of the headings) per section,
+    sections start with separator
+    Everything from the end of the last kept term up to the next section is
+    dropped, except the end tags of the elements still open there and the
+    elements the next section's separator sits in, so the html stays balanced.
+    Only the tags are scanned, no DOM is built.
+    """
+    if not terms_limit or terms_limit < 0:
+        return html
+
+    kept = []
+    # start of the kept text not yet copied to kept
+    start = 0
+    # (name, start) of the elements open in the kept html, and in the dropped part
+    open_tags = []
+    dropped_tags = []
+    dropping = False
+    terms = 0
+    for match in TAG_PATTERN.finditer(html):
+        tag = match.group(0)
+        is_end, name = match.group(1), match.group(2)
+        if name is None:
+            # comments stay with the text around them
+            continue
+        name = name.lower()
+
+        if tag == separator:
+            terms = 0
+            if dropping:
+                dropping = False
+                # the separator is kept along with the dropped elements it is
+                # nested in, which are what's left open once its own start tag
+                # ended the ones it implies
+                _implied_ends(dropped_tags, name)
+                start = dropped_tags[0][1] if dropped_tags else match.start()
+                open_tags.extend(dropped_tags)
+
+        if dropping:
+            if not is_end:
+                _implied_ends(dropped_tags, name)
+                if name not in VOID_TAGS and not tag.endswith("/>"):
+                    dropped_tags.append((name, match.start()))
+            elif not _close_tag(dropped_tags, name) and _close_tag(open_tags, name):
+                kept.append(tag)
+                # whatever was still open in the dropped part was inside it
+                dropped_tags = []
+            continue
+
+        if not is_end:
+            _implied_ends(open_tags, name)
+            if name not in VOID_TAGS and not tag.endswith("/>"):
+                open_tags.append((name, match.start()))
+            continue
+        _close_tag(open_tags, name)
+        if name == "a" and not any(open_name == "h2" for open_name, _ in open_tags):
+            terms += 1
+            if terms >= terms_limit:
+                kept.append(html[start : match.end()])
+                dropping = True
+                dropped_tags = []
+
+    if not dropping:
+        kept.append(html[start:])
+    return "".join(kept)
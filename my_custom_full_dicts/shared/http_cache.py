@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), ".http_cache"
+)
+
+# bump when the layout of the cache changes
+CACHE_VERSION = "1"
+
+# refresh: ask the server with If-None-Match/If-Modified-Since, a 304 is served
+#          from the cache
+# cached:  serve anything in the cache without asking, fetch only what's missing
+# offline: serve only from the cache, never touch the network
+CACHE_MODES = ("refresh", "cached", "offline")
+
+# describe one transfer, not the page, so they aren't kept
+HOP_HEADERS = (
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "content-encoding",
+    "content-length",
+)
+# what a 304 may update of the stored headers
+REVALIDATED_HEADERS = ("etag", "last-modified", "date", "expires", "cache-control")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _replace_file(path, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fd:
+        fd.write(data)
+    os.replace(tmp_path, path)
+
+
+class ResponseCache:
+    """
+    Persistent http responses for re-scraping the same sites
+
+    Bodies are stored gzipped under the sha256 of their content, so pages that
+    didn't change (or the same page under two urls) are stored once, and each
+    url gets a small json entry: final url, status, headers (with the
+    ETag/Last-Modified validators) and the hash of its body.
+    Only successful (2xx) responses without Cache-Control: no-store are kept.
+
+    Usage:
+        cache = ResponseCache(DEFAULT_CACHE_DIR)
+        entry = cache.entry(url)
+        headers = cache.validators(entry)   # {"If-None-Match": ...}
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, url) -> str:
+        key = _sha256(f"{CACHE_VERSION}\0{url}".encode("utf8"))
+        return os.path.join(self.cache_dir, "entries", key[:2], f"{key}.json")
+
+    def _body_path(self, body_hash) -> str:
+        return os.path.join(self.cache_dir, "bodies", body_hash[:2], f"{body_hash}.gz")
+
+    def entry(self, url):
+        """
+        Returns:
+            the stored entry of url ({"url", "status", "headers", "body",
+            "stored"}), None when it isn't cached or its body went missing
+        """
+        try:
+            with open(self._entry_path(url), "r", encoding="utf8") as fd:
+                entry = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        if not os.path.isfile(self._body_path(entry["body"])):
+            return None
+        return entry
+
+    def body(self, entry) -> bytes:
+        with gzip.open(self._body_path(entry["body"]), "rb") as fd:
+            return fd.read()
+
+    @staticmethod
+    def validators(entry) -> dict:
+        """
+        Returns:
+            the conditional request headers to revalidate entry, {} for None
+        """
+        headers = dict()
+        if entry is None:
+            return headers
+        if "etag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if "last-modified" in entry["headers"]:
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    @staticmethod
+    def storable(status, headers) -> bool:
+        return 200 <= status < 300 and "no-store" not in headers.get(
+            "cache-control", ""
+        )
+
+    def _write_entry(self, url, entry) -> None:
+        data = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        _replace_file(self._entry_path(url), data.encode("utf8"))
+
+    def put(self, url, final_url, status, headers, body: bytes):
+        """
+        Store a response fetched for url (final_url is where the redirects led)
+
+        Returns:
+            the new entry
+        """
+        body_hash = _sha256(body)
+        body_path = self._body_path(body_hash)
+        if not os.path.isfile(body_path):
+            # mtime=0 so the same body always gives the same file
+            _replace_file(body_path, gzip.compress(body, mtime=0))
+        entry = {
+            "url": final_url,
+            "status": status,
+            "headers": {
+                name: value
+                for name, value in headers.items()
+                if name not in HOP_HEADERS
+            },
+            "body": body_hash,
+            "stored": time.time(),
+        }
+        self._write_entry(url, entry)
+        return entry
+
+    def revalidated(self, url, entry, headers):
+        """
+        The server answered 304 Not Modified for entry, take over its new
+        validators
+
+        Returns:
+            the updated entry
+        """
+        for name in REVALIDATED_HEADERS:
+            if name in headers:
+                entry["headers"][name] = headers[name]
+        entry["stored"] = time.time()
+        self._write_entry(url, entry)
+        return entry
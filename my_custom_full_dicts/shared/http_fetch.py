@@ -0,0 +1,510 @@
+import asyncio
+import random
+import ssl
+import zlib
+from urllib.parse import quote, urljoin, urlsplit
+
+from http_cache import CACHE_MODES, DEFAULT_CACHE_DIR, ResponseCache
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0"
+# statuses worth another try: rate limited or a server having a bad moment
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+# characters left as they are when quoting the path of a url with japanese in it
+SAFE_URL_CHARS = "/%:@!$&'()*+,;=-._~?"
+
+
+class FetchError(Exception):
+    pass
+
+
+class Response:
+    """
+    A fully read http response, answers the parts of the urlopen response
+    the scrapers use (read(), getcode(), geturl(), status, headers)
+    """
+
+    def __init__(self, url, status, reason, headers, body, from_cache=False):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        # lowercased names
+        self.headers = headers
+        self.body = body
+        self.from_cache = from_cache
+
+    def read(self) -> bytes:
+        return self.body
+
+    def getcode(self) -> int:
+        return self.status
+
+    def geturl(self) -> str:
+        return self.url
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def __repr__(self):
+        return f"<Response {self.status} {self.url}>"
+
+
+class _Host:
+    def __init__(self, per_host):
+        self.slots = asyncio.Semaphore(per_host)
+        # idle keep-alive connections, (reader, writer)
+        self.idle = []
+        self.next_start = 0.0
+
+
+def _decode_body(body, encoding):
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompress(body, zlib.MAX_WBITS | 16)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # some servers send raw deflate without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+async def _read_headers(reader):
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n"):
+            return headers
+        if not line:
+            raise ConnectionResetError("connection closed in the middle of the headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            raise ConnectionResetError("connection closed in the middle of a chunk")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            # trailers, then the empty line
+            await _read_headers(reader)
+            return b"".join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+class Fetcher:
+    """
+    asyncio http/1.1 client for scraping many pages of a few sites
+
+    Connections are kept alive and reused per host, at most per_host requests
+    run against one host at a time, and requests to one host start at most rate
+    per second. Connection errors, timeouts and RETRY_STATUSES are retried up
+    to retries times with exponential backoff and full jitter (Retry-After is
+    honored when the server sends one).
+    Plain http works the same as https, so it can be pointed at a local server.
+    With a http_cache.ResponseCache, pages are kept on disk and revalidated (or
+    served without asking) according to cache_mode.
+
+    Usage:
+        async with Fetcher(per_host=4, rate=10) as fetcher:
+            response = await fetcher.fetch("https://ja.edewakaru.com/")
+            async for url, response, error in fetcher.fetch_all(urls):
+                ...
+    """
+
+    def __init__(
+        self,
+        per_host=4,
+        max_in_flight=32,
+        rate=None,
+        timeout=10.0,
+        retries=3,
+        backoff=0.5,
+        max_backoff=30.0,
+        headers=None,
+        cache=None,
+        cache_mode="refresh",
+    ):
+        """
+        Args:
+            per_host        :   max concurrent requests (and pooled connections)
+                                per host
+            max_in_flight   :   max urls fetch_all works on at once, over all hosts
+            rate            :   max requests started per second per host, None for
+                                no limit
+            timeout         :   seconds for connecting, and for every read
+            retries         :   tries after the first one
+            backoff         :   base delay of the exponential backoff, in seconds
+            headers         :   extra request headers
+            cache           :   http_cache.ResponseCache, None to not cache
+            cache_mode      :   one of http_cache.CACHE_MODES
+        """
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(
+                f"cache_mode should be one of {', '.join(CACHE_MODES)}, "
+                f"got {cache_mode}"
+            )
+        self.per_host = per_host
+        self.max_in_flight = max_in_flight
+        self.interval = 1.0 / rate if rate else 0.0
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+        self.headers.update(headers or {})
+        self.cache = cache
+        self.cache_mode = cache_mode
+        self._hosts = dict()
+        self._ssl = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _host(self, key) -> _Host:
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _Host(self.per_host)
+        return host
+
+    async def _wait_turn(self, host):
+        # every request books the next start time of its host before sleeping,
+        # so a burst gets spread out instead of all waking up together
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, host.next_start)
+        host.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _connect(self, scheme, hostname, port):
+        context = None
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        return await asyncio.wait_for(
+            asyncio.open_connection(hostname, port, ssl=context), self.timeout
+        )
+
+    async def _exchange(self, connection, method, target, headers):
+        """
+        Returns:
+            (status, reason, headers, body, whether the connection can be reused)
+        """
+        reader, writer = connection
+        lines = [f"{method} {target} HTTP/1.1"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        # "HTTP/1.1 200 OK", the reason may be missing
+        parts = status_line.decode("latin-1").split(None, 2)
+        version, status = parts[0], int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ""
+        response_headers = await asyncio.wait_for(_read_headers(reader), self.timeout)
+
+        reusable = version == "HTTP/1.1"
+        if "close" in response_headers.get("connection", "").lower():
+            reusable = False
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in response_headers.get("transfer-encoding", "").lower():
+            body = await asyncio.wait_for(_read_chunked(reader), self.timeout)
+        elif "content-length" in response_headers:
+            length = int(response_headers["content-length"])
+            body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        else:
+            # delimited by the end of the connection
+            body = await asyncio.wait_for(reader.read(), self.timeout)
+            reusable = False
+
+        encoding = response_headers.get("content-encoding")
+        if encoding and body:
+            body = _decode_body(body, encoding)
+        return status, reason.strip(), response_headers, body, reusable
+
+    async def _request(self, url, method="GET", headers=None) -> Response:
+        """
+        One request on a pooled connection, no retries or redirects
+        A pooled connection the server already closed is replaced by a new one.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise FetchError(f"{url}: only http and https urls can be fetched")
+        port = parts.port or (443 if scheme == "https" else 80)
+        target = quote(parts.path or "/", safe=SAFE_URL_CHARS)
+        if parts.query:
+            target = f"{target}?{quote(parts.query, safe=SAFE_URL_CHARS)}"
+        request_headers = {"Host": parts.netloc}
+        request_headers.update(self.headers)
+        request_headers.update(headers or {})
+
+        host = self._host((scheme, parts.hostname, port))
+        async with host.slots:
+            await self._wait_turn(host)
+            while True:
+                reused = bool(host.idle)
+                if reused:
+                    connection = host.idle.pop()
+                else:
+                    connection = await self._connect(scheme, parts.hostname, port)
+                try:
+                    status, reason, response_headers, body, reusable = (
+                        await self._exchange(
+                            connection, method, target, request_headers
+                        )
+                    )
+                except ConnectionError:
+                    # an idle connection the server closed, not a cut response
+                    connection[1].close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    connection[1].close()
+                    raise
+                break
+            if reusable:
+                host.idle.append(connection)
+            else:
+                connection[1].close()
+        return Response(url, status, reason, response_headers, body)
+
+    def _delay(self, attempt, response=None) -> float:
+        if response is not None:
+            retry_after = response.getheader("retry-after", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        # full jitter: anywhere between 0 and the exponential ceiling
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    async def fetch(self, url, headers=None) -> Response:
+        """
+        GET url, following redirects and retrying failures, through the cache
+        when there is one
+
+        Returns:
+            the final Response, also when its status is an error (4xx, or
+            RETRY_STATUSES still failing after the retries)
+        Raises:
+            FetchError  :   no response after the retries (connection errors,
+                            timeouts), too many redirects, or url isn't cached
+                            in offline mode
+        """
+        cache = self.cache
+        if cache is None:
+            return await self._fetch_redirected(url, headers)
+
+        # the cache files are small, reading them inline doesn't stall the loop
+        entry = cache.entry(url)
+        if entry is not None and self.cache_mode != "refresh":
+            return self._cached_response(entry)
+        if self.cache_mode == "offline":
+            raise FetchError(f"{url}: not in the cache (offline mode)")
+
+        request_headers = dict(headers or {})
+        request_headers.update(cache.validators(entry))
+        response = await self._fetch_redirected(url, request_headers)
+        if response.status == 304 and entry is not None:
+            return self._cached_response(
+                cache.revalidated(url, entry, response.headers)
+            )
+        if cache.storable(response.status, response.headers):
+            cache.put(
+                url, response.url, response.status, response.headers, response.body
+            )
+        return response
+
+    def _cached_response(self, entry) -> Response:
+        return Response(
+            entry["url"],
+            entry["status"],
+            "",
+            dict(entry["headers"]),
+            self.cache.body(entry),
+            from_cache=True,
+        )
+
+    async def _fetch_redirected(self, url, headers) -> Response:
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._fetch_retrying(url, headers)
+            location = response.getheader("location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            url = urljoin(url, location)
+        raise FetchError(f"{url}: more than {MAX_REDIRECTS} redirects")
+
+    async def _fetch_retrying(self, url, headers):
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._request(url, headers=headers)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                if attempt == self.retries:
+                    raise FetchError(f"{url}: {type(e).__name__} {e}") from e
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            except (ValueError, FetchError) as e:
+                # a response that isn't http, trying again won't fix it
+                raise FetchError(f"{url}: {e}") from e
+            if response.status not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def _fetch_result(self, url):
+        try:
+            return url, await self.fetch(url), None
+        except FetchError as e:
+            return url, None, e
+
+    async def fetch_all(self, urls):
+        """
+        Fetch urls concurrently, taking new ones from the iterable as others
+        finish, so at most max_in_flight are started but not yet yielded
+
+        Yields:
+            (url, Response or None, FetchError or None), in the order they finish
+        """
+        urls = iter(urls)
+        pending = set()
+
+        def start_more():
+            while len(pending) < self.max_in_flight:
+                url = next(urls, None)
+                if url is None:
+                    return
+                pending.add(asyncio.ensure_future(self._fetch_result(url)))
+
+        start_more()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pending.discard(task)
+                    yield task.result()
+                start_more()
+        finally:
+            # the caller stopped early
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    async def close(self):
+        for host in self._hosts.values():
+            for _, writer in host.idle:
+                writer.close()
+            host.idle = []
+
+
+def iter_fetch(urls, **options):
+    """
+    Synchronous front of Fetcher.fetch_all, for the scraper scripts
+    The event loop only runs while waiting for the next result, requests still
+    in flight pause while the caller works on the previous one.
+
+    Args:
+        urls    :   any iterable of urls, read lazily
+        options :   as Fetcher
+    Yields:
+        (url, Response or None, FetchError or None), in the order they finish
+    """
+    loop = asyncio.new_event_loop()
+    fetcher = Fetcher(**options)
+    results = fetcher.fetch_all(urls)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(fetcher.close())
+        loop.close()
+
+
+# one loop and one fetcher for all try_access_site calls, so the keep-alive
+# connections survive from one call to the next
+_sync_loop = None
+_sync_fetchers = dict()
+# (cache_dir, cache_mode) of try_access_site, see set_cache
+_sync_cache = (DEFAULT_CACHE_DIR, "refresh")
+
+
+def set_cache(cache_dir=DEFAULT_CACHE_DIR, mode="refresh"):
+    """
+    Where (and how) try_access_site caches pages, mode="offline" rebuilds a
+    dictionary from the cached html without touching the network
+
+    Args:
+        cache_dir   :   None to not cache
+        mode        :   one of http_cache.CACHE_MODES
+    """
+    global _sync_cache
+    if mode not in CACHE_MODES:
+        raise ValueError(f"cache mode should be one of {', '.join(CACHE_MODES)}")
+    _sync_cache = (cache_dir, mode)
+    for fetcher in _sync_fetchers.values():
+        _sync_loop.run_until_complete(fetcher.close())
+    _sync_fetchers.clear()
+
+
+def try_access_site(site, sleep_time=0.08, num_retries=3, wait_time=15.0, timeout=5):
+    """
+    Fetch one page, same signature as the old urlopen based helpers
+    Pages go through the response cache set with set_cache (by default
+    DEFAULT_CACHE_DIR, revalidated on every call).
+
+    Args:
+        sleep_time  :   base delay of the backoff between tries
+        num_retries :   tries after the first one
+        wait_time   :   give up (None) when the tries took longer than this
+        timeout     :   seconds for connecting, and for every read
+    Returns:
+        the Response, None when the site couldn't be fetched (or isn't cached in
+        offline mode) or answered with an error status
+    """
+    global _sync_loop
+    if _sync_loop is None:
+        _sync_loop = asyncio.new_event_loop()
+    key = (sleep_time, num_retries, timeout)
+    fetcher = _sync_fetchers.get(key)
+    if fetcher is None:
+        cache_dir, cache_mode = _sync_cache
+        fetcher = _sync_fetchers[key] = Fetcher(
+            per_host=1,
+            timeout=timeout,
+            retries=num_retries,
+            backoff=sleep_time,
+            cache=ResponseCache(cache_dir) if cache_dir else None,
+            cache_mode=cache_mode,
+        )
+    try:
+        response = _sync_loop.run_until_complete(
+            asyncio.wait_for(fetcher.fetch(site), wait_time)
+        )
+    except (FetchError, asyncio.TimeoutError):
+        return None
+    if response.status >= 400:
+        return None
+    return response
@@ -0,0 +1,77 @@
+class SuffixIndex:
+    """
+    Ending -> value lookup table for finding the longest ending of a word
+
+    Instead of walking every ending with endswith, each suffix of the word
+    (longest first) is probed against a hash table of endings, so a lookup costs
+    O(len(word)) probes no matter how many endings are stored.
+    Suffix lengths outside the range of stored endings are never probed.
+
+    Usage:
+        index = SuffixIndex({"る": ["v1"], "する": ["vs"]})
+        index.longest_match("勉強する")   # ('する', ['vs'])
+        index.get("食べる", "")           # ['v1']
+    """
+
+    def __init__(self, mapping=None):
+        self._table = dict()
+        self._min_len = 0
+        self._max_len = 0
+        if mapping:
+            self.update(mapping)
+
+    def add(self, ending: str, value) -> None:
+        """
+        Later additions of the same ending overwrite earlier ones (same as dict)
+        """
+        if not self._table:
+            self._min_len = self._max_len = len(ending)
+        else:
+            self._min_len = min(self._min_len, len(ending))
+            self._max_len = max(self._max_len, len(ending))
+        self._table[ending] = value
+
+    def update(self, mapping) -> None:
+        for ending, value in mapping.items():
+            self.add(ending, value)
+
+    def longest_match(self, word: str) -> tuple:
+        """
+        Returns:
+            (ending, value) of the longest stored ending of word
+            (None, None) if nothing matched
+        """
+        table = self._table
+        if not table:
+            return None, None
+
+        word_len = len(word)
+        longest = min(self._max_len, word_len)
+        for length in range(longest, self._min_len - 1, -1):
+            ending = word[word_len - length :]
+            if ending in table:
+                return ending, table[ending]
+
+        return None, None
+
+    def get(self, word: str, default=None):
+        """
+        Returns:
+            the value of the longest ending of word, else default
+        """
+        ending, value = self.longest_match(word)
+        if ending is None:
+            return default
+        return value
+
+    def endswith(self, word: str) -> bool:
+        """
+        Same as word.endswith(tuple_of_all_endings)
+        """
+        return self.longest_match(word)[0] is not None
+
+    def __contains__(self, ending) -> bool:
+        return ending in self._table
+
+    def __len__(self) -> int:
+        return len(self._table)
@@ -0,0 +1,51 @@
+from html_cut import first_sections, limit_terms
+
+SEPARATOR = '<h2 class="dictNm">'
+# the heading of the next section, nested in the "wrp" table like on weblio
+NEXT_SECTION = (
+    '<table class="wrp"><tr><td><h2 class="dictNm"><a>辞書</a></h2></td></tr>'
+    "</table><div><a>次</a></div>"
+)
+
+
+def test_first_sections_keeps_the_separator():
+    text = f"info{SEPARATOR}one{SEPARATOR}two{SEPARATOR}three"
+    assert first_sections(text, SEPARATOR, 3) == [
+        f"info{SEPARATOR}",
+        f"one{SEPARATOR}",
+        f"two{SEPARATOR}",
+    ]
+
+
+def test_limit_terms_under_the_limit_is_unchanged():
+    html = f'<div class="Wrigo"><a>一</a><a>二</a></div>{NEXT_SECTION}'
+    assert limit_terms(html, 2, SEPARATOR) == html
+    assert limit_terms(html, 0, SEPARATOR) == html
+
+
+def test_limit_terms_closes_what_the_kept_terms_are_in():
+    html = (
+        '<div class="Wrigo"><ul><li><a>一</a><li><a>二</a><li><a>三</a></ul>'
+        f"<b>残り</b></div>{NEXT_SECTION}"
+    )
+    assert limit_terms(html, 1, SEPARATOR) == (
+        f'<div class="Wrigo"><ul><li><a>一</a></ul></div>{NEXT_SECTION}'
+    )
+
+
+def test_limit_terms_unclosed_p_in_a_dropped_term():
+    html = (
+        '<div class="Wrigo"><a>一</a><a>二</a><p><a>三</a><p><a>四</a></div>'
+        f"{NEXT_SECTION}"
+    )
+    assert limit_terms(html, 2, SEPARATOR) == (
+        f'<div class="Wrigo"><a>一</a><a>二</a></div>{NEXT_SECTION}'
+    )
+
+
+def test_limit_terms_unclosed_p_before_the_next_heading():
+    # the p is ended by the table the heading sits in, not an ancestor of it
+    html = f'<div class="Wrigo"><a>一</a><p><a>二</a>{NEXT_SECTION}</div>'
+    assert limit_terms(html, 1, SEPARATOR) == (
+        f'<div class="Wrigo"><a>一</a>{NEXT_SECTION}</div>'
+    )
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from http_cache import ResponseCache
+from http_fetch import Fetcher, FetchError
+
+
+class StandInServer:
+    """
+    Local http/1.1 server with keep-alive, counting connections and requests
+
+    /ok/<x>     200, body "page <x>"
+    /missing    404
+    /busy       503 twice, then 200
+    /cut        the first answer stops in the middle of the body, then 200
+    /broken     always stops in the middle of the body
+    /etag       200 with an ETag, 304 when asked with it
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = dict()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                path = request_line.split()[1].decode("latin-1")
+                seen = self.requests[path] = self.requests.get(path, 0) + 1
+                if not await self.answer(writer, path, seen, headers):
+                    break
+        finally:
+            writer.close()
+
+    async def answer(self, writer, path, seen, headers) -> bool:
+        """
+        Returns:
+            False when the connection was cut
+        """
+        if path == "/missing":
+            self.send(writer, "404 Not Found", b"no such page")
+        elif path == "/busy" and seen <= 2:
+            self.send(writer, "503 Service Unavailable", b"")
+        elif path == "/broken" or (path == "/cut" and seen == 1):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\npartial")
+            await writer.drain()
+            return False
+        elif path == "/etag" and headers.get("if-none-match") == '"v1"':
+            self.send(writer, "304 Not Modified", None, {"ETag": '"v1"'})
+        elif path == "/etag":
+            self.send(writer, "200 OK", b"tagged page", {"ETag": '"v1"'})
+        else:
+            self.send(writer, "200 OK", f"page {path.split('/')[-1]}".encode())
+        await writer.drain()
+        return True
+
+    @staticmethod
+    def send(writer, status, body, headers=None):
+        lines = [f"HTTP/1.1 {status}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        writer.write(
+            ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        )
+
+
+def run_with_server(test):
+    async def main():
+        server = await StandInServer().start()
+        try:
+            return await test(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_keep_alive_connections_are_reused():
+    async def test(server):
+        urls = [f"{server.base}/ok/{i}" for i in range(20)]
+        async with Fetcher(per_host=2, backoff=0.01) as fetcher:
+            results = [result async for result in fetcher.fetch_all(urls)]
+        assert sorted(response.read() for _, response, _ in results) == sorted(
+            f"page {i}".encode() for i in range(20)
+        )
+        assert all(error is None for _, _, error in results)
+        # 20 requests over at most per_host connections
+        assert server.connections <= 2
+
+    run_with_server(test)
+
+
+def test_error_statuses_are_returned_and_busy_ones_retried():
+    async def test(server):
+        async with Fetcher(backoff=0.01) as fetcher:
+            missing = await fetcher.fetch(f"{server.base}/missing")
+            busy = await fetcher.fetch(f"{server.base}/busy")
+        assert (missing.status, missing.read()) == (404, b"no such page")
+        assert server.requests["/missing"] == 1
+        assert (busy.status, busy.read()) == (200, b"page busy")
+        assert server.requests["/busy"] == 3
+
+    run_with_server(test)
+
+
+def test_mid_stream_disconnect_is_retried_then_reported():
+    async def test(server):
+        async with Fetcher(retries=2, backoff=0.01) as fetcher:
+            cut = await fetcher.fetch(f"{server.base}/cut")
+            with pytest.raises(FetchError):
+                await fetcher.fetch(f"{server.base}/broken")
+        assert (cut.status, cut.read()) == (200, b"page cut")
+        assert server.requests["/cut"] == 2
+        assert server.requests["/broken"] == 3
+
+    run_with_server(test)
+
+
+def test_cache_revalidates_and_serves_offline(tmp_path):
+    async def test(server):
+        cache = ResponseCache(str(tmp_path))
+        url = f"{server.base}/etag"
+        async with Fetcher(cache=cache) as fetcher:
+            first = await fetcher.fetch(url)
+            second = await fetcher.fetch(url)
+        async with Fetcher(cache=cache, cache_mode="offline") as fetcher:
+            offline = await fetcher.fetch(url)
+            with pytest.raises(FetchError):
+                await fetcher.fetch(f"{server.base}/ok/never")
+        assert not first.from_cache and second.from_cache and offline.from_cache
+        assert first.read() == second.read() == offline.read() == b"tagged page"
+        # the revalidation was a request, the offline fetches weren't
+        assert server.requests == {"/etag": 2}
+
+    run_with_server(test)
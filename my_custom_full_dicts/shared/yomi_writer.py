@@ -0,0 +1,58 @@
+import io
+import json
+import os
+import zipfile
+
+
+def _write_term_bank(zip_file: zipfile.ZipFile, bank_number: int, terms: list) -> None:
+    print(f"creating term_bank_{bank_number}.json")
+    with zip_file.open(f"term_bank_{bank_number}.json", "w") as raw_out:
+        with io.TextIOWrapper(raw_out, encoding="utf8") as f_out:
+            json.dump(terms, f_out, indent=4, ensure_ascii=False)
+
+
+def write_yomichan_zip(entries, zip_path: str, index: dict, terms_per_file: int) -> int:
+    """
+    Stream term entries straight into a yomichan dictionary zip
+
+    Each term_bank_N.json is flushed into the archive as soon as it holds
+    terms_per_file entries, so only one bank is ever kept in memory, and
+    index.json is written once at the end.
+    The archive is built under a temporary name and moved over zip_path when done,
+    or removed if writing it fails.
+
+    Args:
+        entries         :   iterable of terms in yomichan format
+        zip_path        :   path of the output .zip
+        index           :   contents of index.json
+        terms_per_file  :   num of max terms per term_bank.json
+    Returns:
+        number of term banks written
+    """
+    tmp_path = f"{zip_path}.tmp"
+    bank_number = 0
+    terms = []
+
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for entry in entries:
+                terms.append(entry)
+                if len(terms) >= terms_per_file:
+                    bank_number += 1
+                    _write_term_bank(zip_file, bank_number, terms)
+                    terms = []
+
+            if terms:
+                bank_number += 1
+                _write_term_bank(zip_file, bank_number, terms)
+
+            zip_file.writestr(
+                "index.json", json.dumps(index, indent=4, ensure_ascii=False)
+            )
+
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return bank_number
@@ -1,14 +1,20 @@
 import glob
 import json
 import os
-import pathlib
 import re
-import shutil
+import sys
 from collections import OrderedDict
 
 import util
 from bs4 import BeautifulSoup
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+from deinflect_rules import load_deinflect_rules  # noqa: E402
+from suffix_index import SuffixIndex  # noqa: E402
+from yomi_writer import write_yomichan_zip  # noqa: E402
+
 DEBUG = False
 
 # TODO: put tsukaiwake at the end, put the list of vocabs after the shared definition
@@ -16,8 +22,22 @@ DEBUG = False
 
 
 def main(raw_json):
-    final_dictionary = []
+    entries = iter_dictionary_entries(raw_json)
+
+    ################################################
+    if not DEBUG:
+        create_dictionary(entries)
+    else:
+        for _ in entries:
+            pass
+    ################################################
+
 
+def iter_dictionary_entries(raw_json):
+    """
+    Yields:
+        one yomichan term per vocab listed in each group's header
+    """
     with open(raw_json, "r", encoding="utf8") as f_in:
         data_in: dict = json.load(f_in, object_pairs_hook=OrderedDict)
 
@@ -40,17 +60,12 @@ def main(raw_json):
             print(f"ctr:{ctr}, {vocab}:{yomi_pos}")
             temp_list = [vocab, reading, "", yomi_pos, 0, contents, ctr, ""]
 
-            final_dictionary.append(temp_list)
+            yield temp_list
             ctr += 1
 
         if ctr >= 100 and DEBUG:
             break
 
-    ################################################
-    if not DEBUG:
-        create_dictionary(final_dictionary)
-    ################################################
-
 
 def get_pos_and_contents(text) -> tuple:
     """
@@ -342,63 +357,18 @@ def create_jmdict_pos_map() -> None:
     json_file_pattern = os.path.join(shin_jmdict_path, "term_bank_*.json")
     json_files = glob.glob(json_file_pattern)
 
-    global JMDICT_ENDINGS
-
     for file_path in json_files:
         with open(file_path, "r", encoding="utf8") as fh:
             data: list = json.load(fh)
 
-        # create tuple for checking with endswith
-        # vocab : pos mapping
+        # vocab : pos mapping, looked up by longest ending
         for entry in data:
             if entry[3]:
-                JMDICT_ENDINGS.append(entry[0])
-                JMDICT_POS_MAP[entry[0]] = entry[3]
-
-    JMDICT_ENDINGS = tuple(JMDICT_ENDINGS)
-
-
-def _return_item_that_endswith(word, lookup):
-    """
-    https://stackoverflow.com/questions/48774616/return-the-value-of-a-matching-item-in-a-python-list
-    Args:
-        lookup: deinflection endings tuple
-
-    Returns:
-        the ending of the word (that matched)
-    """
-    return next((s for s in lookup if word.endswith(s)), None)
+                JMDICT_INDEX.add(entry[0], entry[3])
 
 
 def get_jmdict_pos(word) -> str:
-    ending = _return_item_that_endswith(word, JMDICT_ENDINGS)
-    return JMDICT_POS_MAP.get(ending, "")
-
-
-def create_foosoft_pos_map() -> None:
-    """
-    based on foosoft's deinflect.json
-    """
-    inflection_endings = []
-    with open("deinflect.json", "r", encoding="utf8") as ff:
-        deinflect = json.load(ff)
-
-    global POS_MAP
-    POS_MAP = OrderedDict()
-
-    for rule in deinflect:
-        inflection_endings.append(rule["kanaIn"])
-        POS_MAP[rule["kanaIn"]] = rule["rulesIn"]
-
-    with open("deinflect2.json", "r", encoding="utf8") as fh:
-        deinflect2 = json.load(fh)
-
-    for rule in deinflect2:
-        inflection_endings.append(rule["kanaOut"])
-        POS_MAP[rule["kanaOut"]] = rule["rulesOut"]
-
-    global INFLECTIONS
-    INFLECTIONS = tuple(inflection_endings)
+    return JMDICT_INDEX.get(word, "")
 
 
 def get_foosoft_pos(word) -> str:
@@ -406,16 +376,10 @@ def get_foosoft_pos(word) -> str:
     Returns:
          yomichan pos (e.g. v1, vk)
     """
-    ending = _return_item_that_endswith(word, INFLECTIONS)
-
-    yomi_pos = POS_MAP.get(ending, "")
-    if yomi_pos:
-        yomi_pos = yomi_pos[0]
+    return load_deinflect_rules().get_pos(word)
 
-    return yomi_pos
 
-
-def create_dictionary(final_list: list) -> None:
+def create_dictionary(final_list) -> None:
     """
     Create yomichan json files and zip them to an archive
 
@@ -426,56 +390,32 @@ def create_dictionary(final_list: list) -> None:
     if DEBUG:
         test_name = "TEST0"
 
-    build_directory = f"yomichan_dictionary_json_files_{build_version}{test_name}"
-    try:
-        os.mkdir(build_directory)
-    except FileExistsError:
-        print("directory already exists")
-
     terms_per_file = 6000
-    max_i = int(len(final_list) / terms_per_file) + 1
-    for i in range(max_i):
-        if pathlib.Path(f"{build_directory}/term_bank{i+1}.json").is_file():
-            os.remove(f"{build_directory}/term_bank{i+1}.json")
-
-        with open(
-            f"{build_directory}/term_bank_{i+1}.json", "w", encoding="utf8"
-        ) as f_out:
-            start = terms_per_file * i
-            end = terms_per_file * (i + 1)
-            print(i)
-            json.dump(final_list[start:end], f_out, indent=4, ensure_ascii=False)
-
-        with open(f"{build_directory}/index.json", "w", encoding="utf8") as f:
-            index = {
-                "title": f"使い方の分かる 類語例解辞典{test_name}",
-                "revision": f"tsukai-ruigo.{build_version}",
-                "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
-                "sequenced": True,
-                "format": 3,
-                "description": """２万５千語の基本的な言葉を６千のグループに分類し、共通する意味、実例、
+    index = {
+        "title": f"使い方の分かる 類語例解辞典{test_name}",
+        "revision": f"tsukai-ruigo.{build_version}",
+        "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
+        "sequenced": True,
+        "format": 3,
+        "description": """２万５千語の基本的な言葉を６千のグループに分類し、共通する意味、実例、
                 使い分けなどについて記述。特に、言葉の微妙なニュアンスの違いや使い方の差異は、
                 豊富な例文と類語対比表を用いて丁寧に解説した。""",
-                "attribution": "https://www.shogakukan.co.jp/books/09505522",
-                "author": "nihongobongo",
-            }
-            json.dump(index, f, indent=4, ensure_ascii=False)
+        "attribution": "https://www.shogakukan.co.jp/books/09505522",
+        "author": "nihongobongo",
+    }
 
-        zip_filename = f"使い方の分かる 類語例解辞典{test_name}"
-        if pathlib.Path(f"{zip_filename}_{build_version}.zip").is_file():
-            os.remove(f"{zip_filename}_{build_version}.zip")
-        shutil.make_archive(f"{zip_filename}_{build_version}", "zip", build_directory)
+    zip_filename = f"使い方の分かる 類語例解辞典{test_name}"
+    write_yomichan_zip(
+        final_list, f"{zip_filename}_{build_version}.zip", index, terms_per_file
+    )
 
 
 if __name__ == "__main__":
     raw_dict_data = "tsukaikata.json"
     _TEMP_POS_LIST = []
     POS_MAP = OrderedDict()
-    JMDICT_ENDINGS = []
-    JMDICT_POS_MAP = OrderedDict()
-    FOOSOFT_POS_MAP = OrderedDict()
+    JMDICT_INDEX = SuffixIndex()
 
     set_global_pos_map()
     create_jmdict_pos_map()
-    create_foosoft_pos_map()
     main(raw_dict_data)
@@ -1,6 +1,5 @@
-import random
-import time
-import urllib.request
+import os
+import sys
 from html.parser import HTMLParser
 from io import StringIO
 
@@ -9,6 +8,12 @@ from bs4 import BeautifulSoup
 from css_parser import parseStyle
 from sudachipy import dictionary, tokenizer
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+# re-exported, the scrapers import it from here
+from http_fetch import try_access_site  # noqa: E402, F401
+
 mode = tokenizer.Tokenizer.SplitMode.C
 tokenizer_obj = dictionary.Dictionary().create()
 
@@ -27,32 +32,6 @@ def generate_reading(text):
     return aggr
 
 
-def try_access_site(site, sleep_time=0.08, num_retries=3, wait_time=15.0, timeout=5):
-    initial_time = time.time()
-    time_margin = 0.02
-
-    response = None
-    try:
-        response = urllib.request.urlopen(site, timeout=timeout)
-
-    except:
-        for i in range(num_retries):
-            lapsed_time = time.time()
-            if lapsed_time - initial_time > wait_time:
-                return None
-
-            try:
-                response = urllib.request.urlopen(site, timeout=timeout)
-            except:
-                # does something like random.uniform(0.06, 0.10)
-                sleep_time = random.uniform(
-                    sleep_time - time_margin, sleep_time + time_margin
-                )
-                time.sleep(sleep_time)
-    finally:
-        return response
-
-
 class MLStripper(HTMLParser):
     def __init__(self):
         super().__init__()
@@ -2,15 +2,22 @@ import csv
 import glob
 import json
 import os
-import pathlib
 import re
-import shutil
+import sys
 from collections import OrderedDict
 
 import util
 from bs4 import BeautifulSoup
 from css_parser import parseStyle
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared")
+)
+from deinflect_rules import load_deinflect_rules  # noqa: E402
+from html_cut import first_sections, limit_terms  # noqa: E402
+from suffix_index import SuffixIndex  # noqa: E402
+from yomi_writer import write_yomichan_zip  # noqa: E402
+
 # TODO: instead of using struct content, just split it along 意義素類語, then format using tabs/spaces
 # TODO: improve clean_definition regex so that it doesn't catch entries beyond thesaurus as bold
 
@@ -20,12 +27,11 @@ shin_jmdict_path = (
     r"D:\1.Michael\JP\Dictionaries\shoui\stephenmk\jmdict_orthographic_variants"
 )
 
-inflections = tuple()
-pos_map = OrderedDict()
+# every dictionary section of a weblio entry starts with its name in this heading
+DICT_SEPARATOR = '<h2 class="dictNm">'
 
 # jmdict inflections
-jmdict_endings = []
-jmdict_pos_map = OrderedDict()
+jmdict_index = SuffixIndex()
 jmdict_reading_map = OrderedDict()
 
 
@@ -37,30 +43,31 @@ def create_jmdict_pos_map() -> None:
     json_file_pattern = os.path.join(shin_jmdict_path, "term_bank_*.json")
     json_files = glob.glob(json_file_pattern)
 
-    global jmdict_endings
-
     for file_path in json_files:
         with open(file_path, "r", encoding="utf8") as fh:
             data: list = json.load(fh)
 
-        # create tuple for checking with endswith
-        # vocab : pos mapping
+        # vocab : pos mapping, looked up by longest ending
         for entry in data:
             if entry[3]:
-                jmdict_endings.append(entry[0])
-                jmdict_pos_map[entry[0]] = entry[3]
+                jmdict_index.add(entry[0], entry[3])
 
             if entry[1]:
                 jmdict_reading_map[entry[0]] = entry[1]
 
-    jmdict_endings = tuple(jmdict_endings)
-
 
 def main() -> None:
-    final_dictionary_list = []
+    #################################################
+    if True:
+        create_weblio_external(iter_dictionary_entries())
+    #################################################
 
-    create_deinflection_endings()
 
+def iter_dictionary_entries():
+    """
+    Yields:
+        one yomichan term per row of the cleaned weblio csv
+    """
     with open(cleaned_csv_path, "r", encoding="utf8") as f_in:
         csvreader = csv.reader(f_in)
         for idx, line in enumerate(csvreader):
@@ -81,13 +88,10 @@ def main() -> None:
             definition = str(line[1])
             definition = return_first_two_defs(definition, terms_limit=10)
 
-            yomi_pos = ""
-            if vocab.endswith(inflections):
-                yomi_pos = get_pos(vocab)
+            yomi_pos = get_pos(vocab)
 
             if not yomi_pos:
-                if vocab.endswith(jmdict_endings):
-                    yomi_pos = get_jmdict_pos(vocab)
+                yomi_pos = get_jmdict_pos(vocab)
 
             if isinstance(definition, list):
                 definition = [e for e in definition if e]
@@ -109,24 +113,21 @@ def main() -> None:
             #     break
 
             print(idx)
-            final_dictionary_list.append(temp_list)
-
-    #################################################
-    if True:
-        create_weblio_external(final_dictionary_list)
-    #################################################
+            yield temp_list
 
 
 def return_first_two_defs(defn, terms_limit=10) -> str:
     """
     Return the first two dictionaries
-    and limit num of entries of each dict to only 7 entries(customizable)
+    and limit num of entries of each dict to only terms_limit entries
+    Both cuts are made on the raw html before anything is parsed, so entries with
+    thousands of synonyms cost about the same as small ones.
     """
     # frst_two = split_but_keep_separator(defn, '<table>')
-    frst_two = split_but_keep_separator(defn, '<h2 class="dictNm">')
     # 3, not 2 because [0] pertains to the info before <h2 class....>
-    frst_two = frst_two[:3]
+    frst_two = first_sections(defn, DICT_SEPARATOR, 3)
     frst_two = "".join(frst_two)
+    frst_two = limit_terms(frst_two, terms_limit, DICT_SEPARATOR)
     frst_two = "<body>" + frst_two + "</body>"
     frst_two = clean_definition(frst_two)
 
@@ -199,9 +200,10 @@ def simplify_content_if_possible(cont):
 def _unwrap_divs(text: str) -> str:
     soup = BeautifulSoup(text, features="html.parser")
     # for class_name in ['kijiWrp', 'kiji', 'Wrugj', 'Wrigo']:
-    x = soup.find_all("div")
-    for i in range(len(x)):
-        soup.div.unwrap()
+    # find_all lists them in document order, the same order soup.div would find
+    # them one after the other
+    for div in soup.find_all("div"):
+        div.unwrap()
 
     return str(soup)
 
@@ -305,63 +307,17 @@ def get_style(inline_style_string):
     return style
 
 
-def create_deinflection_endings() -> None:
-    """
-    sets the values of the global suffix inflections table
-    also sets a pos map (ending : pos) dictionary
-    """
-    inflection_endings = []
-    with open("deinflect.json", "r", encoding="utf8") as ff:
-        deinflect = json.load(ff)
-
-    global pos_map
-    pos_map = OrderedDict()
-
-    for rule in deinflect:
-        inflection_endings.append(rule["kanaIn"])
-        pos_map[rule["kanaIn"]] = rule["rulesIn"]
-
-    with open("deinflect2.json", "r", encoding="utf8") as fh:
-        deinflect2 = json.load(fh)
-
-    for rule in deinflect2:
-        inflection_endings.append(rule["kanaOut"])
-        pos_map[rule["kanaOut"]] = rule["rulesOut"]
-
-    global inflections
-    inflections = tuple(inflection_endings)
-
-
-# https://stackoverflow.com/questions/48774616/return-the-value-of-a-matching-item-in-a-python-list
-def _check_if_in_lookup(word, lookup):
-    """
-    Args:
-        lookup: deinflection endings tuple
-
-    Returns:
-        the ending of the word (that matched)
-    """
-    return next((s for s in lookup if word.endswith(s)), None)
-
-
 def get_pos(word) -> str:
     """
     Returns:
         its yomichan part of speech
         e.g. v1, v5, adj-i, etc.
     """
-    ending = _check_if_in_lookup(word, inflections)
-
-    yomi_pos = pos_map.get(ending, "")
-    if yomi_pos:
-        yomi_pos = yomi_pos[0]
-
-    return yomi_pos
+    return load_deinflect_rules().get_pos(word)
 
 
 def get_jmdict_pos(word) -> str:
-    ending = _check_if_in_lookup(word, jmdict_endings)
-    return jmdict_pos_map.get(ending, "")
+    return jmdict_index.get(word, "")
 
 
 def get_jmdict_reading(word) -> str:
@@ -375,44 +331,23 @@ def create_weblio_external(final_list):
     build_version = "v_1.02"
     # v_1.02, simplify overly-complex divs, remove <b>, simplified list of strings to a single string
 
-    build_directory = f"yomichan_dictionary_json_files_{build_version}"
-    try:
-        os.mkdir(build_directory)
-    except FileExistsError:
-        print("directory already exists")
-
     terms_per_file = 40000
-    max_i = int(len(final_list) / terms_per_file) + 1
-    for i in range(max_i):
-        if pathlib.Path(f"{build_directory}/term_bank{i+1}.json").is_file():
-            os.remove(f"{build_directory}/term_bank{i+1}.json")
-
-        with open(
-            f"{build_directory}/term_bank_{i+1}.json", "w", encoding="utf8"
-        ) as f_out:
-            start = terms_per_file * i
-            end = terms_per_file * (i + 1)
-            print(i)
-            json.dump(final_list[start:end], f_out, indent=4, ensure_ascii=False)
-
-        with open(f"{build_directory}/index.json", "w", encoding="utf8") as f:
-            index = {
-                "title": "Weblio類語辞書",
-                "revision": f"weblio-ruigi-jisho-int.{build_version}",
-                "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
-                "sequenced": True,
-                "format": 3,
-                "description": """様々な同義語や同意語の日本語表現を約40万語を収録。\n 使う場面やニュアンスごとに、類語とシソーラスを分類・整理。
+    index = {
+        "title": "Weblio類語辞書",
+        "revision": f"weblio-ruigi-jisho-int.{build_version}",
+        "url": "https://github.com/aiko-tanaka/Grammar-Dictionaries/",
+        "sequenced": True,
+        "format": 3,
+        "description": """様々な同義語や同意語の日本語表現を約40万語を収録。\n 使う場面やニュアンスごとに、類語とシソーラスを分類・整理。
 リンクによって「類語の類語」を簡単に検索。\n 名詞や形容詞、感嘆符など、品詞の区別にとらわれず類語を紹介。 \n 通俗表現やセリフも多数収録。""",
-                "attribution": "https://thesaurus.weblio.jp/",
-                "author": "nihongobongo",
-            }
-            json.dump(index, f, indent=4, ensure_ascii=False)
-
-        zip_filename = "Weblio類語辞書_internal"
-        if pathlib.Path(f"{zip_filename}_{build_version}.zip").is_file():
-            os.remove(f"{zip_filename}_{build_version}.zip")
-        shutil.make_archive(f"{zip_filename}_{build_version}", "zip", build_directory)
+        "attribution": "https://thesaurus.weblio.jp/",
+        "author": "nihongobongo",
+    }
+
+    zip_filename = "Weblio類語辞書_internal"
+    write_yomichan_zip(
+        final_list, f"{zip_filename}_{build_version}.zip", index, terms_per_file
+    )
 
 
 if __name__ == "__main__":